@@ -1,6 +1,9 @@
 import os
 from PyPDF2 import PdfReader
 from langchain.text_splitter import CharacterTextSplitter
+from ingestion import INGESTION_WORKERS, chunk_all_pdfs
+from ingestion_manifest import IngestionManifest
+from alloydb_store import PgVectorPool
 from google.cloud import alloydb_v1beta
 from vertexai.preview.language_models import TextGenerationModel
 
@@ -15,6 +18,13 @@ ALLOYDB_PORT = "5432"
 ALLOYDB_USER = "your-username"
 ALLOYDB_PASSWORD = "your-password"
 ALLOYDB_DATABASE = "your-database"
+ALLOYDB_POOL = PgVectorPool(
+    host=ALLOYDB_HOST,
+    port=ALLOYDB_PORT,
+    user=ALLOYDB_USER,
+    password=ALLOYDB_PASSWORD,
+    dbname=ALLOYDB_DATABASE,
+)
 
 # Path to PDF folder
 PDF_FOLDER = "./pdfs"
@@ -36,10 +46,7 @@ def read_pdf(pdf_path):
     """Read and extract text from a PDF file."""
     try:
         reader = PdfReader(pdf_path)
-        pdf_text = ""
-        for page in reader.pages:
-            pdf_text += page.extract_text()
-        return pdf_text
+        return "".join(page.extract_text() for page in reader.pages)
     except Exception as e:
         print(f"Error reading PDF file {pdf_path}: {e}")
         return ""
@@ -50,7 +57,7 @@ def split_text_into_chunks(text, chunk_size=300, chunk_overlap=100):
     return text_splitter.split_text(text)
 
 def generate_embeddings(chunks):
-    """Generate embeddings using Vertex AI."""
+    """Generate embeddings using Vertex AI, one per chunk (None where embedding failed)."""
     embeddings = []
     for chunk in chunks:
         try:
@@ -59,61 +66,46 @@ def generate_embeddings(chunks):
             embeddings.append(embedding)
         except Exception as e:
             print(f"Error generating embedding for chunk: {e}")
+            embeddings.append(None)
     return embeddings
 
 def create_vector_store_in_alloydb(store_name, chunks, embeddings):
     """
-    Store embeddings into AlloyDB.
-    
+    Store embeddings into AlloyDB with batched COPY, resuming an interrupted load of the same chunks.
+
     Args:
         store_name (str): Name of the bucket.
         chunks (list): List of text chunks.
         embeddings (list): Embeddings for the chunks.
 
     Returns:
-        None
+        bool: True if every chunk was stored; chunks without an embedding
+        are skipped and filled in by the next load of the same chunks.
     """
     try:
-        import psycopg2
-        connection = psycopg2.connect(
-            host=ALLOYDB_HOST,
-            port=ALLOYDB_PORT,
-            user=ALLOYDB_USER,
-            password=ALLOYDB_PASSWORD,
-            dbname=ALLOYDB_DATABASE,
-        )
-        cursor = connection.cursor()
-
-        # Create table for the vector store
-        cursor.execute(f"""
-        CREATE TABLE IF NOT EXISTS {store_name} (
-            id SERIAL PRIMARY KEY,
-            text_chunk TEXT,
-            embedding VECTOR(768)  -- Adjust dimension as per your model
-        );
-        """)
-        connection.commit()
-
-        # Insert chunks and embeddings into the table
-        for chunk, embedding in zip(chunks, embeddings):
-            cursor.execute(
-                f"INSERT INTO {store_name} (text_chunk, embedding) VALUES (%s, %s)",
-                (chunk, list(embedding)),
-            )
-        connection.commit()
-
+        # Adjust dimension as per your model
+        ALLOYDB_POOL.bulk_load(store_name, chunks, embeddings, dimension=768, source_id="text-bison@001")
+        missing = sum(embedding is None for embedding in embeddings)
+        if missing:
+            print(f"{missing} chunks of {store_name} have no embedding; they will be retried on the next run.")
+            return False
         print(f"Data stored successfully in AlloyDB for {store_name}.")
+        return True
     except Exception as e:
         print(f"Error storing data in AlloyDB: {e}")
-    finally:
-        if connection:
-            cursor.close()
-            connection.close()
+        return False
+
+def delete_vectors_from_alloydb(store_name):
+    """Drop a bucket's table, if it exists, before re-ingesting or after its file was deleted."""
+    try:
+        ALLOYDB_POOL.drop_table(store_name)
+    except Exception as e:
+        print(f"Error deleting data from AlloyDB: {e}")
 
 def retrieve_from_alloydb(store_name, query_embedding, top_k=5):
     """
     Retrieve relevant documents from AlloyDB using embeddings.
-    
+
     Args:
         store_name (str): Name of the bucket.
         query_embedding (list): Query embedding.
@@ -123,54 +115,33 @@ def retrieve_from_alloydb(store_name, query_embedding, top_k=5):
         list: Relevant text chunks.
     """
     try:
-        import psycopg2
-        connection = psycopg2.connect(
-            host=ALLOYDB_HOST,
-            port=ALLOYDB_PORT,
-            user=ALLOYDB_USER,
-            password=ALLOYDB_PASSWORD,
-            dbname=ALLOYDB_DATABASE,
-        )
-        cursor = connection.cursor()
-
-        cursor.execute(f"""
-        SELECT text_chunk
-        FROM {store_name}
-        ORDER BY embedding <-> %s
-        LIMIT {top_k};
-        """, (query_embedding,))
-        results = cursor.fetchall()
-        return [row[0] for row in results]
+        return ALLOYDB_POOL.top_k(store_name, query_embedding, top_k)
     except Exception as e:
         print(f"Error retrieving data from AlloyDB: {e}")
         return []
-    finally:
-        if connection:
-            cursor.close()
-            connection.close()
 
 ### Main Functions ###
-def process_all_pdfs():
+def process_all_pdfs(max_workers=INGESTION_WORKERS):
     """
     Process all PDFs and store them in AlloyDB.
+
+    PDF extraction and chunking run in a process pool, one task per bucket;
+    embedding and storage happen here as each bucket finishes. Buckets whose
+    file is unchanged since the last run are skipped, and the tables of
+    deleted files are dropped.
     """
     print("\nProcessing all PDFs and storing data in AlloyDB...")
 
-    for store_name, pdf_path in PDF_FILES.items():
-        print(f"\nProcessing '{store_name}' bucket...")
-
-        if not validate_file_path(pdf_path):
-            print(f"Skipping '{store_name}' bucket due to missing file.")
-            continue
-
-        pdf_text = read_pdf(pdf_path)
-        if not pdf_text:
-            print(f"Skipping '{store_name}' bucket due to empty content in {pdf_path}.")
-            continue
+    manifest = IngestionManifest("alloydb", params={"embedding_model": "text-bison@001"})
+    for store_name in manifest.removed_buckets(PDF_FILES):
+        delete_vectors_from_alloydb(store_name)
+        manifest.forget(store_name)
 
-        text_chunks = split_text_into_chunks(pdf_text)
+    for store_name, text_chunks in chunk_all_pdfs(PDF_FILES, max_workers, manifest=manifest):
         embeddings = generate_embeddings(text_chunks)
-        create_vector_store_in_alloydb(store_name, text_chunks, embeddings)
+        # The loader replaces the bucket's previous rows, or resumes an interrupted load
+        if create_vector_store_in_alloydb(store_name, text_chunks, embeddings):
+            manifest.record(store_name)
 
     print("\nAll PDFs have been processed and stored successfully.")
 
@@ -1,12 +1,23 @@
 import os
 from PyPDF2 import PdfReader
 from langchain.text_splitter import CharacterTextSplitter
+from ingestion import INGESTION_WORKERS, stream_all_pdfs
+from embedding_cache import default_cache, default_query_cache
+from async_embedding import AsyncEmbeddingClient
+from vector_index import VectorIndex
+from mmap_store import load_index, remove_index, save_index
+from rerank import MMR_FETCH_K, merge_adjacent, mmr_rerank
+from ingestion_manifest import IngestionManifest
 from google.cloud import aiplatform
 from vertexai.preview.language_models import TextEmbeddingModel
 
 # Initialize Vertex AI
 aiplatform.init(project="playpen-33fcd2", location="europe-central12")
-EMBEDDING_MODEL = TextEmbeddingModel.from_pretrained("textembedding-gecko@003")
+EMBEDDING_MODEL_NAME = "textembedding-gecko@003"
+EMBEDDING_MODEL = TextEmbeddingModel.from_pretrained(EMBEDDING_MODEL_NAME)
+EMBEDDING_CLIENT = AsyncEmbeddingClient(
+    lambda batch: [response.values for response in EMBEDDING_MODEL.get_embeddings(batch)]
+)
 
 # Path to PDF folder
 PDF_FOLDER = "./pdfs"
@@ -16,7 +27,13 @@ PDF_FILES = {
     "platform_engineer": os.path.join(PDF_FOLDER, "Platform_Engineer.pdf"),
 }
 
-# In-memory store for embeddings and text chunks
+# Buckets at least this large get an approximate (IVF) index
+ANN_MIN_CHUNKS = int(os.environ.get("ANN_MIN_CHUNKS", "50000"))
+
+# Memory-mapped copies of each bucket's index, reused across restarts
+STORE_DIR = "./vector_stores"
+
+# In-memory store of one VectorIndex (embeddings and text chunks) per bucket
 VECTOR_STORE = {}
 
 ### Utility Functions ###
@@ -31,10 +48,7 @@ def read_pdf(pdf_path):
     """Read and extract text from a PDF file."""
     try:
         reader = PdfReader(pdf_path)
-        pdf_text = ""
-        for page in reader.pages:
-            pdf_text += page.extract_text()
-        return pdf_text
+        return "".join(page.extract_text() for page in reader.pages)
     except Exception as e:
         print(f"Error reading PDF file {pdf_path}: {e}")
         return ""
@@ -45,62 +59,87 @@ def split_text_into_chunks(text, chunk_size=300, chunk_overlap=100):
     return text_splitter.split_text(text)
 
 def generate_embeddings(chunks):
-    """Generate embeddings using Vertex AI's TextEmbeddingModel."""
-    embeddings = []
-    for chunk in chunks:
-        try:
-            response = EMBEDDING_MODEL.get_embeddings([chunk])
-            embeddings.append(response[0].values)  # Ensure proper extraction
-        except Exception as e:
-            print(f"Error generating embedding for chunk: {e}")
-    return embeddings
+    """Generate embeddings using Vertex AI's TextEmbeddingModel, reusing cached vectors (None where embedding failed)."""
+    return default_cache().embed(EMBEDDING_MODEL_NAME, chunks, _embed_chunks)
+
+def _embed_chunks(chunks):
+    """Embed chunks in batched requests, several in flight within the rate limits."""
+    return EMBEDDING_CLIENT.embed(chunks)
 
 ### Main Functions ###
-def process_all_pdfs():
+def process_all_pdfs(max_workers=INGESTION_WORKERS):
     """
     Process all PDFs and store embeddings and text in an in-memory store.
+
+    PDF extraction and chunking run in a process pool, one task per bucket;
+    embedding and storage happen here as each bucket finishes. Every bucket
+    is also saved under STORE_DIR, so unchanged buckets are memory-mapped
+    from disk on the next run instead of being re-embedded.
     """
     print("\nProcessing all PDFs and storing data...")
 
-    for store_name, pdf_path in PDF_FILES.items():
-        print(f"\nProcessing '{store_name}' bucket...")
-
-        if not validate_file_path(pdf_path):
-            print(f"Skipping '{store_name}' bucket due to missing file.")
-            continue
-
-        pdf_text = read_pdf(pdf_path)
-        if not pdf_text:
-            print(f"Skipping '{store_name}' bucket due to empty content in {pdf_path}.")
-            continue
+    manifest = IngestionManifest("alloy", params={"embedding_model": EMBEDDING_MODEL_NAME})
+    for store_name in manifest.removed_buckets(PDF_FILES):
+        remove_index(os.path.join(STORE_DIR, store_name))
+        manifest.forget(store_name)
+    for store_name in PDF_FILES:
+        if not os.path.exists(os.path.join(STORE_DIR, store_name)):
+            manifest.forget(store_name)
+
+    for store_name, batches in stream_all_pdfs(PDF_FILES, max_workers, manifest=manifest):
+        # Embed and index one batch at a time so only the index itself grows with the bucket
+        index = VectorIndex()
+        missing = 0
+        for text_chunks, sources in batches:
+            embeddings = generate_embeddings(text_chunks)
+            missing += sum(embedding is None for embedding in embeddings)
+            index.add(text_chunks, embeddings, sources=sources)
+        index.build_lexical()
+        if len(index) >= ANN_MIN_CHUNKS:
+            print(f"Building ANN index for '{store_name}' ({len(index)} chunks)...")
+            index.build_ann()
+        save_index(os.path.join(STORE_DIR, store_name), index, {"embedding_model": EMBEDDING_MODEL_NAME})
+        if missing:
+            # Leave the bucket unrecorded so the next run retries the missing chunks
+            print(f"{missing} chunks of '{store_name}' have no embedding; they will be retried on the next run.")
+        else:
+            manifest.record(store_name)
+        VECTOR_STORE[store_name] = index
 
-        text_chunks = split_text_into_chunks(pdf_text)
-        embeddings = generate_embeddings(text_chunks)
-        VECTOR_STORE[store_name] = {"chunks": text_chunks, "embeddings": embeddings}
+    for store_name in PDF_FILES:
+        if store_name not in VECTOR_STORE and store_name in manifest.entries:
+            VECTOR_STORE[store_name] = load_index(os.path.join(STORE_DIR, store_name))
+            print(f"Loaded '{store_name}' bucket from {STORE_DIR} ({len(VECTOR_STORE[store_name])} chunks).")
 
     print("\nAll PDFs have been processed and stored successfully.")
 
 def retrieve_relevant_chunks(store_name, query, top_k=5):
-    """Retrieve relevant text chunks based on query embedding similarity."""
+    """
+    Retrieve relevant text chunks based on query embedding similarity.
+
+    MMR_FETCH_K candidates are reranked by maximal marginal relevance down
+    to top_k, and overlapping chunks are joined, so the same sentences are
+    not returned twice.
+    """
     if store_name not in VECTOR_STORE:
         print(f"Store '{store_name}' not found.")
         return []
 
+    index = VECTOR_STORE[store_name]
+    try:
+        query_embedding = default_query_cache().embed_query(
+            EMBEDDING_MODEL_NAME, query, lambda text: EMBEDDING_MODEL.get_embeddings([text])[0].values  # Proper extraction
+        )
+    except Exception as e:
+        # Keyword search still works while the embedding service is down
+        print(f"Error generating query embedding, using keyword search: {e}")
+        hits = mmr_rerank(index, index.search_lexical(query, max(MMR_FETCH_K, top_k)), top_k)
+        return [text for _, text, _ in merge_adjacent(index, hits)]
+
     try:
-        query_embedding = EMBEDDING_MODEL.get_embeddings([query])[0].values  # Proper extraction
-        store_data = VECTOR_STORE[store_name]
-        chunks = store_data["chunks"]
-        embeddings = store_data["embeddings"]
-
-        # Compute similarity (dot product or cosine similarity)
-        similarities = [
-            (i, sum(e * q for e, q in zip(embedding, query_embedding)))
-            for i, embedding in enumerate(embeddings)
-        ]
-        # Sort by similarity
-        similarities.sort(key=lambda x: x[1], reverse=True)
-        top_indices = [i[0] for i in similarities[:top_k]]
-        return [chunks[i] for i in top_indices]
+        # Cosine similarity against the whole bucket fused with BM25 keyword scores
+        hits = index.search_hybrid(query_embedding, query, max(MMR_FETCH_K, top_k))
+        return [text for _, text, _ in merge_adjacent(index, mmr_rerank(index, hits, top_k))]
     except Exception as e:
         print(f"Error during query processing: {e}")
         return []
@@ -150,27 +189,4 @@ def main():
     interactive_chat()
 
 if __name__ == "__main__":
-    main()////////////////////
-
-
-
-def main():
-    print("=" * 80)
-    print("Welcome to the Agentic AI-Powered Document Query System")
-    print("This system processes and stores documents, enabling efficient querying by job family.")
-    print("=" * 80)
-
-    # Step 1: Process PDFs and store data
-    process_all_pdfs()
-
-    # Step 2: Verify and print stored data
-    print("\nChecking stored data in VECTOR_STORE:")
-    for store_name, store_data in VECTOR_STORE.items():
-        if store_data["embeddings"]:
-            print(f"\nData stored successfully for bucket: {store_name}")
-            print(f"First embedding (truncated): {store_data['embeddings'][0][:5]}...")  # Print first 5 values
-        else:
-            print(f"\nNo embeddings found for bucket: {store_name}")
-
-    # Step 3: Interactive Chat
-    interactive_chat()
+    main()
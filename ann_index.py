@@ -0,0 +1,165 @@
+import hashlib
+import os
+import time
+import numpy as np
+from vector_index import normalize_rows, top_k_rows
+
+# Search-time default; higher probes more lists for better recall at more latency
+ANN_NPROBE = int(os.environ.get("ANN_NPROBE", "16"))
+
+_BLOCK_ROWS = 8192
+
+
+class IVFIndex:
+    """
+    Inverted-file approximate nearest neighbour index over a VectorIndex matrix.
+
+    A spherical k-means coarse quantizer splits the (normalized) rows into
+    ``nlist`` lists. A query is compared with the centroids first and then
+    scored exactly against the rows of the ``nprobe`` closest lists only.
+    The row matrix itself is not copied; the index only stores centroids and
+    the row ids of each list.
+    """
+
+    def __init__(self, nlist=None, n_iter=20, sample_per_list=64, nprobe=ANN_NPROBE, seed=0):
+        self.nlist = nlist
+        self.n_iter = n_iter
+        self.sample_per_list = sample_per_list
+        self.nprobe = nprobe
+        self.seed = seed
+        self.centroids = None
+        self.list_rows = None
+        self.list_offsets = None
+        self.fingerprint = None
+
+    def build(self, matrix):
+        """
+        Train the coarse quantizer and assign every row to a list.
+
+        Args:
+            matrix (np.ndarray): (n, dimension) float32 matrix with normalized rows.
+        """
+        n = len(matrix)
+        nlist = min(self.nlist or max(1, int(4 * np.sqrt(n))), n)
+        rng = np.random.default_rng(self.seed)
+        sample_size = min(n, nlist * self.sample_per_list)
+        sample = matrix[np.sort(rng.choice(n, sample_size, replace=False))]
+
+        centroids = sample[rng.choice(sample_size, nlist, replace=False)].copy()
+        for _ in range(self.n_iter):
+            assignment = _nearest(sample, centroids)
+            order = np.argsort(assignment, kind="stable")
+            counts = np.bincount(assignment, minlength=nlist)
+            starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+            non_empty = counts > 0
+            sums = np.add.reduceat(sample[order], starts[non_empty], axis=0)
+            centroids[non_empty] = sums
+            # Re-seed empty lists from random sample rows
+            empty = np.flatnonzero(~non_empty)
+            if len(empty):
+                centroids[empty] = sample[rng.choice(sample_size, len(empty), replace=False)]
+            centroids = normalize_rows(centroids)
+
+        assignment = _nearest(matrix, centroids)
+        self.centroids = centroids.astype(np.float32)
+        self.list_rows = np.argsort(assignment, kind="stable").astype(np.int64)
+        self.list_offsets = np.concatenate(([0], np.cumsum(np.bincount(assignment, minlength=nlist)))).astype(np.int64)
+        self.nlist = nlist
+        self.fingerprint = matrix_fingerprint(matrix)
+        return self
+
+    def search(self, matrix, query, top_k=5, nprobe=None):
+        """
+        Approximate top-k search.
+
+        Args:
+            matrix (np.ndarray): The normalized matrix the index was built on.
+            query (np.ndarray): Normalized query vector.
+            top_k (int): Number of results to return.
+            nprobe (int): Lists to scan; defaults to the index's nprobe.
+
+        Returns:
+            list: (row index, score) pairs, best first.
+        """
+        nprobe = min(nprobe or self.nprobe, self.nlist)
+        lists = np.argpartition(-(self.centroids @ query), nprobe - 1)[:nprobe]
+        candidates = np.concatenate([
+            self.list_rows[self.list_offsets[i]:self.list_offsets[i + 1]] for i in lists
+        ])
+        if not len(candidates):
+            return []
+        return [(int(candidates[i]), score) for i, score in top_k_rows(matrix[candidates] @ query, top_k)]
+
+    def save(self, path):
+        np.savez(
+            path,
+            centroids=self.centroids,
+            list_rows=self.list_rows,
+            list_offsets=self.list_offsets,
+            fingerprint=np.frombuffer(self.fingerprint.encode("ascii"), dtype=np.uint8),
+            params=np.array([self.nlist, self.n_iter, self.sample_per_list, self.seed], dtype=np.int64),
+        )
+
+    @classmethod
+    def load(cls, path, nprobe=ANN_NPROBE):
+        """Load a saved index; nprobe is a search-time setting and is not stored."""
+        with np.load(path) as data:
+            nlist, n_iter, sample_per_list, seed = (int(value) for value in data["params"])
+            index = cls(nlist, n_iter, sample_per_list, nprobe, seed)
+            index.centroids = data["centroids"]
+            index.list_rows = data["list_rows"]
+            index.list_offsets = data["list_offsets"]
+            index.fingerprint = data["fingerprint"].tobytes().decode("ascii")
+        return index
+
+
+def matrix_fingerprint(matrix):
+    """Cheap identity check for a matrix: its shape plus a hash of up to 64 evenly spaced rows."""
+    rows = np.unique(np.linspace(0, len(matrix) - 1, num=min(64, len(matrix)), dtype=np.int64))
+    digest = hashlib.sha256(np.ascontiguousarray(matrix[rows]).tobytes()).hexdigest()[:16]
+    return f"{matrix.shape[0]}x{matrix.shape[1]}-{digest}"
+
+
+def recall_report(index, queries, top_k=10, nprobe_values=(1, 2, 4, 8, 16, 32, 64)):
+    """
+    Compare ANN search against exact search on the same VectorIndex.
+
+    Args:
+        index (VectorIndex): Index with an ANN structure built.
+        queries (np.ndarray): (q, dimension) query vectors, e.g. a sample of stored rows.
+        top_k (int): k for recall@k.
+        nprobe_values (tuple): nprobe settings to measure.
+
+    Returns:
+        list: One dict per setting with nprobe, recall and mean latency in milliseconds;
+        the first entry is exact search.
+    """
+    queries = normalize_rows(np.asarray(queries, dtype=np.float32))
+    matrix = index.embeddings
+
+    start = time.perf_counter()
+    exact = [{i for i, _ in top_k_rows(matrix @ query, top_k)} for query in queries]
+    exact_ms = (time.perf_counter() - start) * 1000 / len(queries)
+    report = [{"nprobe": "exact", "recall": 1.0, "latency_ms": exact_ms}]
+
+    for nprobe in nprobe_values:
+        if nprobe > index.ann.nlist:
+            break
+        start = time.perf_counter()
+        found = [{i for i, _ in index.ann.search(matrix, query, top_k, nprobe)} for query in queries]
+        latency_ms = (time.perf_counter() - start) * 1000 / len(queries)
+        recall = np.mean([len(f & e) / len(e) for f, e in zip(found, exact)])
+        report.append({"nprobe": nprobe, "recall": float(recall), "latency_ms": latency_ms})
+
+    print(f"\nrecall@{top_k} vs latency over {len(queries)} queries ({len(matrix)} vectors, {index.ann.nlist} lists):")
+    for row in report:
+        print(f"  nprobe={row['nprobe']!s:>6}  recall={row['recall']:.3f}  latency={row['latency_ms']:.3f} ms")
+    return report
+
+
+def _nearest(rows, centroids):
+    """Index of the most similar centroid for each row, computed in blocks to bound memory."""
+    assignment = np.empty(len(rows), dtype=np.int64)
+    for start in range(0, len(rows), _BLOCK_ROWS):
+        assignment[start:start + _BLOCK_ROWS] = np.argmax(rows[start:start + _BLOCK_ROWS] @ centroids.T, axis=1)
+    return assignment
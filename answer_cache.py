@@ -0,0 +1,153 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+import numpy as np
+from vector_index import normalize_rows
+
+ANSWER_CACHE_MAX_ENTRIES = int(os.environ.get("ANSWER_CACHE_MAX_ENTRIES", "4096"))
+ANSWER_CACHE_TTL_SECONDS = float(os.environ.get("ANSWER_CACHE_TTL_SECONDS", "86400"))
+
+# Cosine similarity at which a cached question's answer is reused for a
+# differently worded one. Fuzzy matches can return the answer to a different
+# question (e.g. "How do I add a user?" vs "How do I remove a user?"), so
+# raise it if wrong answers show up; above 1 disables the semantic tier.
+ANSWER_CACHE_SIMILARITY = float(os.environ.get("ANSWER_CACHE_SIMILARITY", "0.95"))
+
+
+def normalize_question(question):
+    """Lower-case, collapse whitespace and drop trailing punctuation."""
+    return " ".join(question.lower().split()).rstrip("?!. ")
+
+
+class AnswerCache:
+    """
+    Two-tier cache of answers to previous questions.
+
+    The exact tier matches the normalized question text. The semantic tier
+    compares the query embedding with the embeddings of cached questions and
+    returns the closest live answer at or above ``similarity_threshold``
+    (ANSWER_CACHE_SIMILARITY), which trades hit rate against the risk of
+    answering a different question that happens to embed nearby. Entries expire
+    after ``ttl_seconds``, the least recently used are evicted beyond
+    ``max_entries``, and everything is dropped when the index version the
+    answers were produced from changes.
+
+    ``stats`` counts every lookup once: get() records a miss, and a
+    get_similar() hit that follows it turns that miss into a semantic hit.
+    """
+
+    def __init__(self, max_entries=ANSWER_CACHE_MAX_ENTRIES, ttl_seconds=ANSWER_CACHE_TTL_SECONDS,
+                 similarity_threshold=ANSWER_CACHE_SIMILARITY):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.similarity_threshold = similarity_threshold
+        self.version = None
+        self.stats = {"exact_hits": 0, "semantic_hits": 0, "misses": 0}
+        self._lock = threading.Lock()
+        self._clear()
+
+    def _clear(self):
+        # key -> (value, expires_at, semantic slot or None)
+        self._entries = OrderedDict()
+        self._vectors = None
+        self._slot_keys = [None] * self.max_entries
+        self._free_slots = list(range(self.max_entries - 1, -1, -1))
+
+    def __len__(self):
+        return len(self._entries)
+
+    def set_version(self, version):
+        """Invalidate every entry if the index version differs from the one the cache was filled from."""
+        with self._lock:
+            if version != self.version:
+                self._clear()
+                self.version = version
+
+    def get(self, question):
+        """Exact-tier lookup; returns the cached value or None."""
+        key = normalize_question(question)
+        with self._lock:
+            value = self._lookup(key)
+            if value is not None:
+                self.stats["exact_hits"] += 1
+            else:
+                self.stats["misses"] += 1
+            return value
+
+    def get_similar(self, query_embedding):
+        """
+        Semantic-tier lookup, meant to follow a get() that missed.
+
+        Every cached question at or above the threshold is tried, most
+        similar first, so an expired or stale best match does not hide a
+        valid one behind it.
+
+        Returns:
+            The value of the most similar live entry, or None.
+        """
+        with self._lock:
+            if self._vectors is None or not len(self._entries):
+                return None
+            query = normalize_rows(np.asarray(query_embedding, dtype=np.float32).reshape(1, -1))[0]
+            scores = self._vectors @ query
+            candidates = np.flatnonzero(scores >= self.similarity_threshold)
+            for slot in candidates[np.argsort(-scores[candidates], kind="stable")]:
+                key = self._slot_keys[slot]
+                if key is None:
+                    continue
+                value = self._lookup(key)
+                if value is not None:
+                    self.stats["misses"] -= 1
+                    self.stats["semantic_hits"] += 1
+                    return value
+            return None
+
+    def put(self, question, value, query_embedding=None, version=None):
+        """
+        Cache an answer.
+
+        Args:
+            question (str): The question asked.
+            value: The answer to return on a hit.
+            query_embedding (list): Question embedding for the semantic tier; None skips it.
+            version: Index version the answer was produced from; an answer
+                from another version than the cache's is not stored.
+        """
+        key = normalize_question(question)
+        with self._lock:
+            if version is not None and version != self.version:
+                # Produced by a request still running on a replaced snapshot
+                return
+            if key in self._entries:
+                self._remove(key)
+            while len(self._entries) >= self.max_entries:
+                self._remove(next(iter(self._entries)))
+
+            slot = None
+            if query_embedding is not None:
+                vector = normalize_rows(np.asarray(query_embedding, dtype=np.float32).reshape(1, -1))[0]
+                if self._vectors is None:
+                    self._vectors = np.zeros((self.max_entries, len(vector)), dtype=np.float32)
+                slot = self._free_slots.pop()
+                self._vectors[slot] = vector
+                self._slot_keys[slot] = key
+            self._entries[key] = (value, time.monotonic() + self.ttl_seconds, slot)
+
+    def _lookup(self, key):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        value, expires_at, _ = entry
+        if time.monotonic() > expires_at:
+            self._remove(key)
+            return None
+        self._entries.move_to_end(key)
+        return value
+
+    def _remove(self, key):
+        _, _, slot = self._entries.pop(key)
+        if slot is not None:
+            self._vectors[slot] = 0.0
+            self._slot_keys[slot] = None
+            self._free_slots.append(slot)
@@ -1,37 +1,426 @@
 from langchain_community.chat_models import ChatOpenAI
 from langchain.chains import RetrievalQA
-from data_reader import DataReader
-from embedding import EmbeddingsGenerator
-from vector_store import VectorStore
+from embedding import CachedEmbeddings, OPENAI_MAX_BATCH_SIZE
+from embedding_batches import token_counter
+from vector_store import IndexRetriever
+from index_snapshot import (
+    DEFAULT_BUCKET, SNAPSHOT_DIR, bucket_dir, current_version, has_snapshot, list_buckets, load_snapshot, snapshot_nbytes,
+)
+from index_registry import INDEX_MEMORY_BUDGET_MB, IndexRegistry
+from answer_cache import AnswerCache, normalize_question
+import asyncio
+from contextlib import asynccontextmanager
 import tiktoken
 import os
 from langchain_community.embeddings import OpenAIEmbeddings
+
+openai_api_key = os.getenv("OPENAI_API_KEY")
+
+# Concurrent LLM calls per worker, and how many more requests may wait for a slot (0 = no limit)
+CHAT_MAX_CONCURRENCY = int(os.getenv("CHAT_MAX_CONCURRENCY", "256"))
+CHAT_MAX_QUEUE = int(os.getenv("CHAT_MAX_QUEUE", "0"))
+
+# Token budget for retrieved context in the prompt (0 = no limit); enforced with
+# the per-chunk token counts stored in token-chunked snapshots
+CHAT_CONTEXT_TOKENS = int(os.getenv("CHAT_CONTEXT_TOKENS", "3000"))
+
+# Concurrent LLM calls for a single batch request, so one batch cannot take every slot
+BATCH_MAX_CONCURRENCY = int(os.getenv("BATCH_MAX_CONCURRENCY", "16"))
+
+# Seconds to wait for a query embedding before answering from BM25 keyword search alone
+QUERY_EMBEDDING_TIMEOUT_SECONDS = float(os.getenv("QUERY_EMBEDDING_TIMEOUT_SECONDS", "5"))
+
+# Retriever metadata passed through to clients; document/page/offsets are
+# only present when the index was built with chunk metadata
+SOURCE_FIELDS = ("row", "score", "document", "page", "char_start", "char_end")
+
+class ServiceBusyError(RuntimeError):
+    pass
+
+class UnknownBucketError(LookupError):
+    pass
+
 class EmbeddingsGenerator:
-    def __init__(self):
+    def __init__(self, tokenizer=None):
         if not openai_api_key:
             raise ValueError("OPENAI_API_KEY environment variable not set")
-        self.embeddings = OpenAIEmbeddings(openai_api_key=openai_api_key)
+        openai_embeddings = OpenAIEmbeddings(openai_api_key=openai_api_key, chunk_size=OPENAI_MAX_BATCH_SIZE)
+        count_tokens = token_counter(tokenizer) if tokenizer else None
+        self.embeddings = CachedEmbeddings(openai_embeddings, openai_embeddings.model, count_tokens=count_tokens)
+
+class KnowledgeBase:
+    """
+    One bucket's loaded snapshot with the retriever, chain and answer cache built on it.
+
+    When a newer snapshot of the bucket replaces this one, the new
+    KnowledgeBase takes over ``answer_cache``; set_version() then drops the
+    answers produced from the old snapshot.
+    """
+
+    def __init__(self, name, directory, index, llm, embeddings, answer_cache=None):
+        self.name = name
+        self.index = index
+        self.version = index.metadata.get("version")
+        self.nbytes = snapshot_nbytes(directory, self.version)
+        if index.lexical is None:
+            # Snapshots from before BM25 was stored: index the chunks in memory
+            index.build_lexical()
+        self.retriever = IndexRetriever(index=index, embeddings=embeddings, max_context_tokens=CHAT_CONTEXT_TOKENS)
+        self.qa_chain = RetrievalQA.from_chain_type(llm=llm, retriever=self.retriever)
+        self.answer_cache = answer_cache if answer_cache is not None else AnswerCache()
+        self.answer_cache.set_version(self.version)
 
 class ChatbotService:
-    def __init__(self, pdf_path):
-        self.reader = DataReader(pdf_path)
-        self.embeddings_generator = EmbeddingsGenerator()
-        self.llm = ChatOpenAI(model_name="gpt-3.5-turbo", temperature=0, api_key= openai_api_key )
-        self.qa_chain = None
-        self.tokenizer = tiktoken.encoding_for_model("gpt-4")
+    """
+    Answers questions from prebuilt per-bucket index snapshots (see index_snapshot.py).
+
+    Each request is routed by bucket name (the API's ``usecase.name``) to
+    that bucket's snapshot, which is memory-mapped on first use and evicted
+    least-recently-used first once the loaded buckets exceed the memory
+    budget. Requests that name no bucket go to ``default_bucket``; naming a
+    bucket without a snapshot is an error, so a misspelled usecase never
+    gets an answer from the wrong knowledge base.
+
+    Construction is cheap; initialize_service() discovers the buckets and
+    loads the default one, and is meant to run in the background while the
+    API already reports its status, so no PDF reading or embedding happens
+    at startup.
+    """
 
-        # Initialize retriever and QA chain
-        self.initialize_service()
+    def __init__(self, snapshot_dir=SNAPSHOT_DIR, max_concurrency=CHAT_MAX_CONCURRENCY, max_queue=CHAT_MAX_QUEUE,
+                 default_bucket=DEFAULT_BUCKET, memory_budget_mb=INDEX_MEMORY_BUDGET_MB):
+        self.snapshot_dir = snapshot_dir
+        self.default_bucket = default_bucket
+        self.tokenizer = tiktoken.encoding_for_model("gpt-4")
+        self.embeddings_generator = EmbeddingsGenerator(self.tokenizer)
+        self.llm = ChatOpenAI(model_name="gpt-3.5-turbo", temperature=0, api_key= openai_api_key )
+        self.buckets = IndexRegistry(
+            self._load_bucket, lambda knowledge_base: knowledge_base.nbytes, memory_budget_mb * 1024 * 1024,
+            stale_fn=self._is_superseded,
+        )
+        self.status = "loading"
+        self.error = None
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.queued = 0
+        self.in_flight = 0
+        self._slots = asyncio.Semaphore(max_concurrency)
 
     def initialize_service(self):
-        pdf_text = self.reader.read_pdf()
-        docs = self.reader.split_text_into_chunks(pdf_text)
-        vector_store = VectorStore(self.embeddings_generator.embeddings)
-        vector_store.create_vector_store(docs)
-        retriever = vector_store.get_retriever()
-        self.qa_chain = RetrievalQA.from_chain_type(llm=self.llm, retriever=retriever)
-
-    def process_question(self, question):
-        if not self.qa_chain:
+        try:
+            available = list_buckets(self.snapshot_dir)
+            if not available:
+                raise FileNotFoundError(
+                    f"No index snapshots found in {self.snapshot_dir}. "
+                    "Build one with: python index_snapshot.py <pdf_path> --bucket <name>"
+                )
+            if self.default_bucket in available:
+                self.buckets.get(self.default_bucket)
+            self.status = "ready"
+        except Exception as e:
+            self.status = "failed"
+            self.error = str(e)
+            print(f"Error loading index snapshot: {e}")
+
+    def _load_bucket(self, name):
+        directory = bucket_dir(name, self.snapshot_dir)
+        index = load_snapshot(directory)
+        print(f"Loaded bucket '{name}' ({len(index)} chunks, snapshot {index.metadata.get('version')}).")
+        previous = self.buckets.peek(name)
+        return KnowledgeBase(
+            name, directory, index, self.llm, self.embeddings_generator.embeddings,
+            previous.answer_cache if previous is not None else None,
+        )
+
+    def _is_superseded(self, name, knowledge_base):
+        # A newer build of the bucket has been published since it was loaded
+        version = current_version(bucket_dir(name, self.snapshot_dir))
+        return version is not None and version != knowledge_base.version
+
+    def resolve_bucket(self, name=None):
+        """
+        Name of the bucket that serves a request for ``name``; the default bucket when no name is given.
+
+        Raises:
+            UnknownBucketError: The named (or default) bucket has no snapshot.
+        """
+        bucket = name or self.default_bucket
+        if bucket in self.buckets or has_snapshot(bucket, self.snapshot_dir):
+            return bucket
+        raise UnknownBucketError(f"No knowledge base for usecase '{bucket}'")
+
+    def knowledge_base(self, name=None):
+        """Return the loaded KnowledgeBase for a bucket, loading it if needed."""
+        if self.status != "ready":
+            raise ValueError("QA Chain not initialized.")
+        return self.buckets.get(self.resolve_bucket(name))
+
+    async def aknowledge_base(self, name=None):
+        """Async knowledge_base(); a bucket that is not loaded yet is opened off the event loop."""
+        if self.status != "ready":
             raise ValueError("QA Chain not initialized.")
-        return self.qa_chain.run(question)
+        resolved = self.resolve_bucket(name)
+        if not self.buckets.needs_load(resolved):
+            return self.buckets.get(resolved)
+        return await asyncio.to_thread(self.buckets.get, resolved)
+
+    def health(self):
+        loaded = self.buckets.loaded()
+        knowledge_bases = {}
+        for name in loaded:
+            knowledge_base = self.buckets.peek(name)
+            if knowledge_base is not None:
+                knowledge_bases[name] = {
+                    "index_version": knowledge_base.version,
+                    "chunks": len(knowledge_base.index),
+                    "bytes": knowledge_base.nbytes,
+                    "answer_cache": dict(knowledge_base.answer_cache.stats, entries=len(knowledge_base.answer_cache)),
+                }
+        return {
+            "status": self.status,
+            "error": self.error,
+            "default_bucket": self.default_bucket,
+            "buckets": {
+                "available": list_buckets(self.snapshot_dir),
+                "loaded": knowledge_bases,
+                "memory_used": self.buckets.memory_used,
+                "memory_budget": self.buckets.memory_budget,
+                **self.buckets.stats,
+            },
+            "chat": {
+                "in_flight": self.in_flight,
+                "queued": self.queued,
+                "max_concurrency": self.max_concurrency,
+            },
+            "query_embedding_cache": self.embeddings_generator.embeddings.query_cache.stats(),
+        }
+
+    def process_question(self, question, bucket=None):
+        knowledge_base = self.knowledge_base(bucket)
+        answer_cache = knowledge_base.answer_cache
+        cached = answer_cache.get(question)
+        if cached is not None:
+            return cached["answer"]
+        query_embedding = None
+        if knowledge_base.retriever.mode != "lexical":
+            try:
+                query_embedding = self.embeddings_generator.embeddings.embed_query(question)
+            except Exception as e:
+                print(f"Query embedding failed, answering from keyword search: {e!r}")
+        if query_embedding is not None:
+            cached = answer_cache.get_similar(query_embedding)
+            if cached is not None:
+                return cached["answer"]
+
+        docs = knowledge_base.retriever.documents_for_embedding(query_embedding, question)
+        result = knowledge_base.qa_chain.combine_documents_chain.invoke({"input_documents": docs, "question": question})
+        answer_cache.put(
+            question, {"answer": result["output_text"], "sources": _sources(docs)}, query_embedding, knowledge_base.version
+        )
+        return result["output_text"]
+
+    async def aprocess_question(self, question, bucket=None):
+        """
+        Answer a question without blocking the event loop.
+
+        Exact cache hits are returned straight away. Otherwise at most
+        ``max_concurrency`` questions are embedded and answered at once; the
+        rest wait for a slot and are counted in ``queued``. A semantically
+        similar cached question still ends the request before the LLM call.
+        """
+        return (await self.aanswer_question(question, bucket))["answer"]
+
+    async def aanswer_question(self, question, bucket=None):
+        """
+        Like aprocess_question(), but returns {"answer": ..., "sources": [...]}
+        so the caller can cite the chunks the answer was produced from.
+        """
+        knowledge_base = await self.aknowledge_base(bucket)
+        cached = knowledge_base.answer_cache.get(question)
+        if cached is not None:
+            return cached
+
+        async with self._chat_slot():
+            cached, query_embedding = await self._asimilar_answer(knowledge_base, question)
+            if cached is not None:
+                return cached
+            docs = await knowledge_base.retriever.adocuments_for_embedding(query_embedding, question)
+            result = await knowledge_base.qa_chain.combine_documents_chain.ainvoke(
+                {"input_documents": docs, "question": question}
+            )
+        answer = {"answer": result["output_text"], "sources": _sources(docs)}
+        knowledge_base.answer_cache.put(question, answer, query_embedding, knowledge_base.version)
+        return answer
+
+    async def astream_answer(self, question, bucket=None):
+        """
+        Answer a question as a stream of events.
+
+        Yields ("sources", [...]) with the retrieved chunks first, then
+        ("token", text) for each piece of the answer as the LLM produces it.
+        The prompt is the one the RetrievalQA chain itself uses. A cached
+        answer is sent as a single token event.
+        """
+        knowledge_base = await self.aknowledge_base(bucket)
+        cached = knowledge_base.answer_cache.get(question)
+        if cached is not None:
+            yield "sources", cached["sources"]
+            yield "token", cached["answer"]
+            return
+
+        async with self._chat_slot():
+            cached, query_embedding = await self._asimilar_answer(knowledge_base, question)
+            if cached is not None:
+                yield "sources", cached["sources"]
+                yield "token", cached["answer"]
+                return
+            docs = await knowledge_base.retriever.adocuments_for_embedding(query_embedding, question)
+            sources = _sources(docs)
+            yield "sources", sources
+
+            combine_chain = knowledge_base.qa_chain.combine_documents_chain
+            context = combine_chain.document_separator.join(doc.page_content for doc in docs)
+            messages = combine_chain.llm_chain.prompt.format_prompt(
+                **{combine_chain.document_variable_name: context, "question": question}
+            ).to_messages()
+            tokens = []
+            async for chunk in self.llm.astream(messages):
+                if chunk.content:
+                    tokens.append(chunk.content)
+                    yield "token", chunk.content
+        knowledge_base.answer_cache.put(
+            question, {"answer": "".join(tokens), "sources": sources}, query_embedding, knowledge_base.version
+        )
+
+    async def aprocess_batch(self, questions, bucket=None, max_concurrency=BATCH_MAX_CONCURRENCY):
+        """
+        Answer a list of questions in one pass.
+
+        Repeats of a question (compared as the answer cache normalizes
+        them) are answered once and the result is copied to every position.
+        Uncached questions are embedded in one request, holding one chat
+        slot, and retrieved with a single batched index search; the LLM calls
+        then run with at most ``max_concurrency`` in flight, each also taking
+        a regular chat slot.
+
+        Args:
+            questions (list): Question strings.
+            bucket (str): Bucket all questions are asked against.
+            max_concurrency (int): Concurrent LLM calls for this batch.
+
+        Returns:
+            list: One dict per question, in order, with either "answer" or "error" set.
+        """
+        knowledge_base = await self.aknowledge_base(bucket)
+        keys = [normalize_question(question) for question in questions]
+        first = {}
+        for i, key in enumerate(keys):
+            first.setdefault(key, i)
+        answers = await self._aanswer_batch(knowledge_base, [questions[i] for i in first.values()], max_concurrency)
+        by_key = dict(zip(first, answers))
+        return [dict(by_key[key]) for key in keys]
+
+    async def _aanswer_batch(self, knowledge_base, questions, max_concurrency):
+        """aprocess_batch() for distinct questions."""
+        answer_cache = knowledge_base.answer_cache
+        results = [None] * len(questions)
+        pending = []
+        for i, question in enumerate(questions):
+            cached = answer_cache.get(question)
+            if cached is not None:
+                results[i] = {"answer": cached["answer"], "error": None}
+            else:
+                pending.append(i)
+        if not pending:
+            return results
+
+        query_embeddings = [None] * len(pending)
+        if knowledge_base.retriever.mode != "lexical":
+            async with self._chat_slot():
+                try:
+                    query_embeddings = await self.embeddings_generator.embeddings.aembed_queries(
+                        [questions[i] for i in pending]
+                    )
+                except Exception as e:
+                    print(f"Query embedding failed, answering the batch from keyword search: {e!r}")
+
+        to_answer = []
+        for i, query_embedding in zip(pending, query_embeddings):
+            cached = answer_cache.get_similar(query_embedding) if query_embedding is not None else None
+            if cached is not None:
+                results[i] = {"answer": cached["answer"], "error": None}
+            else:
+                to_answer.append((i, query_embedding))
+        if not to_answer:
+            return results
+
+        embedded = query_embeddings[0] is not None
+        all_docs = await knowledge_base.retriever.adocuments_for_embeddings(
+            [embedding for _, embedding in to_answer] if embedded else None, [questions[i] for i, _ in to_answer]
+        )
+        batch_slots = asyncio.Semaphore(max_concurrency)
+
+        async def answer(i, query_embedding, docs):
+            async with batch_slots, self._chat_slot():
+                result = await knowledge_base.qa_chain.combine_documents_chain.ainvoke(
+                    {"input_documents": docs, "question": questions[i]}
+                )
+            answer_cache.put(
+                questions[i], {"answer": result["output_text"], "sources": _sources(docs)}, query_embedding,
+                knowledge_base.version,
+            )
+            return result["output_text"]
+
+        answers = await asyncio.gather(
+            *(answer(i, embedding, docs) for (i, embedding), docs in zip(to_answer, all_docs)),
+            return_exceptions=True,
+        )
+        for (i, _), answer_or_error in zip(to_answer, answers):
+            if isinstance(answer_or_error, Exception):
+                results[i] = {"answer": None, "error": str(answer_or_error)}
+            else:
+                results[i] = {"answer": answer_or_error, "error": None}
+        return results
+
+    async def _asimilar_answer(self, knowledge_base, question):
+        """
+        Embed the question and look it up in the semantic tier of the bucket's
+        answer cache; returns (cached value or None, query embedding).
+
+        Called inside a chat slot after the exact tier missed. The embedding
+        is None in lexical mode, or when the embedding service fails or takes
+        longer than QUERY_EMBEDDING_TIMEOUT_SECONDS; retrieval then falls
+        back to keyword search.
+        """
+        if knowledge_base.retriever.mode == "lexical":
+            return None, None
+        try:
+            query_embedding = await asyncio.wait_for(
+                self.embeddings_generator.embeddings.aembed_query(question), QUERY_EMBEDDING_TIMEOUT_SECONDS
+            )
+        except Exception as e:
+            print(f"Query embedding failed, answering from keyword search: {e!r}")
+            return None, None
+        return knowledge_base.answer_cache.get_similar(query_embedding), query_embedding
+
+    @asynccontextmanager
+    async def _chat_slot(self):
+        if self.max_queue and self.queued >= self.max_queue:
+            raise ServiceBusyError(f"{self.queued} requests already waiting")
+        self.queued += 1
+        try:
+            await self._slots.acquire()
+        finally:
+            self.queued -= 1
+        self.in_flight += 1
+        try:
+            yield
+        finally:
+            self.in_flight -= 1
+            self._slots.release()
+
+def _sources(docs):
+    return [
+        {**{field: doc.metadata[field] for field in SOURCE_FIELDS if field in doc.metadata}, "text": doc.page_content}
+        for doc in docs
+    ]
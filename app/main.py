@@ -1,14 +1,32 @@
+import asyncio
+import json
+import os
+from contextlib import asynccontextmanager
+from typing import List, Optional
 from fastapi import FastAPI, HTTPException, Header
+from fastapi.responses import JSONResponse, StreamingResponse
 from fastapi.staticfiles import StaticFiles
 from pydantic import BaseModel
-from app.chatbot_service import ChatbotService
+from app.chatbot_service import ChatbotService, ServiceBusyError, UnknownBucketError
 
-# Initialize chatbot service
-PDF_PATH = "Data_LLM.pdf"  # Replace with your PDF file path
-chatbot_service = ChatbotService(pdf_path=PDF_PATH)
+# Initialize chatbot service; each bucket's index snapshot is built offline with
+# `python index_snapshot.py Data_LLM.pdf --bucket <usecase name>` and only loaded here.
+chatbot_service = ChatbotService()
+
+# Largest number of questions accepted by one /chat/batch request
+BATCH_MAX_QUESTIONS = int(os.getenv("BATCH_MAX_QUESTIONS", "1000"))
+
+@asynccontextmanager
+async def lifespan(app):
+    # Load in the background so the server binds immediately and /health
+    # can report progress while the snapshot is opened.
+    loader = asyncio.create_task(asyncio.to_thread(chatbot_service.initialize_service))
+    yield
+    if not loader.done():
+        loader.cancel()
 
 # FastAPI app
-app = FastAPI()
+app = FastAPI(lifespan=lifespan)
 
 # Serve static files (e.g., favicon.ico)
 app.mount("/static", StaticFiles(directory="static"), name="static")
@@ -22,8 +40,25 @@ class ChatRequest(BaseModel):
     question: str
     usecase: Usecase
 
+class Citation(BaseModel):
+    document: str
+    page: int
+    score: float
+
 class ChatResponse(BaseModel):
     feedback: str
+    citations: List[Citation] = []
+
+class BatchChatRequest(BaseModel):
+    questions: List[str]
+    usecase: Usecase
+
+class BatchChatResult(BaseModel):
+    feedback: Optional[str] = None
+    error: Optional[str] = None
+
+class BatchChatResponse(BaseModel):
+    results: List[BatchChatResult]
 
 @app.get("/")
 def read_root():
@@ -33,15 +68,92 @@ def read_root():
 def get_favicon():
     return {"message": "No favicon available"}
 
+@app.get("/assist-genie/api/v1/health")
+def health_endpoint():
+    # 503 until the index is loaded, so readiness probes hold traffic back
+    health = chatbot_service.health()
+    return JSONResponse(status_code=200 if health["status"] == "ready" else 503, content=health)
+
 @app.post("/assist-genie/api/v1/chat", response_model=ChatResponse)
-def chat_endpoint(request: ChatRequest, authorization: str = Header(...)):
+async def chat_endpoint(request: ChatRequest, authorization: str = Header(...)):
     # Authorization check
     if not authorization or not authorization.startswith("Bearer "):
         raise HTTPException(status_code=401, detail="Unauthorized")
 
+    if chatbot_service.status != "ready":
+        raise HTTPException(status_code=503, detail=f"Service {chatbot_service.status}, index not available yet")
+
     # Process the question
     try:
-        response = chatbot_service.process_question(request.question)
-        return ChatResponse(feedback=response)
+        response = await chatbot_service.aanswer_question(request.question, request.usecase.name)
+        return ChatResponse(feedback=response["answer"], citations=citations(response["sources"]))
+    except UnknownBucketError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except ServiceBusyError as e:
+        raise HTTPException(status_code=503, detail=f"Service busy: {str(e)}")
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Unexpected server error: {str(e)}")
+
+@app.post("/assist-genie/api/v1/chat/stream")
+async def chat_stream_endpoint(request: ChatRequest, authorization: str = Header(...)):
+    # Same contract as /chat, but the answer is sent as server-sent events:
+    # one "sources" event, then "token" events, then "done" (or "error").
+    if not authorization or not authorization.startswith("Bearer "):
+        raise HTTPException(status_code=401, detail="Unauthorized")
+
+    if chatbot_service.status != "ready":
+        raise HTTPException(status_code=503, detail=f"Service {chatbot_service.status}, index not available yet")
+
+    async def events():
+        try:
+            async for event, data in chatbot_service.astream_answer(request.question, request.usecase.name):
+                yield sse_event(event, data)
+            yield sse_event("done", {})
+        except UnknownBucketError as e:
+            yield sse_event("error", {"status": 404, "detail": str(e)})
+        except ServiceBusyError as e:
+            yield sse_event("error", {"status": 503, "detail": f"Service busy: {str(e)}"})
+        except Exception as e:
+            yield sse_event("error", {"status": 500, "detail": f"Unexpected server error: {str(e)}"})
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+@app.post("/assist-genie/api/v1/chat/batch", response_model=BatchChatResponse)
+async def chat_batch_endpoint(request: BatchChatRequest, authorization: str = Header(...)):
+    # Results come back in request order; a failed question carries an
+    # error instead of failing the whole batch.
+    if not authorization or not authorization.startswith("Bearer "):
+        raise HTTPException(status_code=401, detail="Unauthorized")
+
+    if chatbot_service.status != "ready":
+        raise HTTPException(status_code=503, detail=f"Service {chatbot_service.status}, index not available yet")
+
+    if len(request.questions) > BATCH_MAX_QUESTIONS:
+        raise HTTPException(status_code=413, detail=f"At most {BATCH_MAX_QUESTIONS} questions per batch")
+
+    try:
+        results = await chatbot_service.aprocess_batch(request.questions, request.usecase.name)
+    except UnknownBucketError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except ServiceBusyError as e:
+        raise HTTPException(status_code=503, detail=f"Service busy: {str(e)}")
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Unexpected server error: {str(e)}")
+    return BatchChatResponse(results=[
+        BatchChatResult(feedback=result["answer"], error=result["error"]) for result in results
+    ])
+
+def citations(sources):
+    # One citation per page, in retrieval order (best first)
+    cited = {}
+    for source in sources:
+        if "document" in source:
+            cited.setdefault((source["document"], source["page"]), source["score"])
+    return [Citation(document=document, page=page, score=score) for (document, page), score in cited.items()]
+
+def sse_event(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
@@ -0,0 +1,159 @@
+import asyncio
+import inspect
+import os
+import random
+import threading
+import time
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+from embedding_batches import MAX_BATCH_SIZE, MAX_BATCH_TOKENS, default_token_counter, pack_batches
+
+# Provider quota and client limits; 0 disables the corresponding rate limit
+EMBEDDING_MAX_CONCURRENCY = int(os.environ.get("EMBEDDING_MAX_CONCURRENCY", "8"))
+EMBEDDING_REQUESTS_PER_MINUTE = int(os.environ.get("EMBEDDING_REQUESTS_PER_MINUTE", "600"))
+EMBEDDING_TOKENS_PER_MINUTE = int(os.environ.get("EMBEDDING_TOKENS_PER_MINUTE", "0"))
+
+RETRYABLE_STATUS_CODES = {429, 500, 502, 503, 504}
+
+
+class TokenBucket:
+    """
+    Token bucket that refills ``rate`` units per second up to ``capacity``.
+
+    acquire() reserves the full amount straight away and, if that leaves
+    the bucket in debt, sleeps until the debt is repaid. A request larger
+    than ``capacity`` is therefore charged in full rather than capped, and
+    callers are served in the order they reserved. The state is guarded by
+    a thread lock, so one bucket can be shared by callers on any event loop.
+    """
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    async def acquire(self, amount=1):
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens -= amount
+            wait = -self.tokens / self.rate if self.tokens < 0 else 0.0
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+
+def is_retryable(error):
+    """True for rate-limit and server errors, across the OpenAI, Google and HTTP client exception types."""
+    if isinstance(error, (asyncio.TimeoutError, ConnectionError)):
+        return True
+    response = getattr(error, "response", None)
+    for status in (getattr(error, "status_code", None), getattr(error, "code", None),
+                   getattr(response, "status_code", None)):
+        if isinstance(status, int):
+            return status in RETRYABLE_STATUS_CODES
+    return False
+
+
+class AsyncEmbeddingClient:
+    """
+    Embeds texts with several batched requests in flight at once.
+
+    Texts are packed with embedding_batches.pack_batches(). Each batch then
+    waits for a concurrency slot and for the request/token buckets before it
+    is sent, so callers can hand over any amount of work without exceeding
+    the quota. 429 and 5xx responses are retried with jittered exponential
+    backoff.
+
+    ``embed_batch`` may be a plain function (run in a worker thread) or a
+    coroutine function; it takes a list of texts and returns their vectors.
+    """
+
+    def __init__(self, embed_batch, max_concurrency=EMBEDDING_MAX_CONCURRENCY,
+                 requests_per_minute=EMBEDDING_REQUESTS_PER_MINUTE, tokens_per_minute=EMBEDDING_TOKENS_PER_MINUTE,
+                 max_retries=5, base_delay=1.0, max_delay=60.0,
+                 max_batch_size=MAX_BATCH_SIZE, max_batch_tokens=MAX_BATCH_TOKENS, count_tokens=None):
+        self.embed_batch = embed_batch
+        self.max_concurrency = max_concurrency
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.max_batch_size = max_batch_size
+        self.max_batch_tokens = max_batch_tokens
+        self.count_tokens = count_tokens or default_token_counter()
+        self.stats = {"requests": 0, "retries": 0, "failed_batches": 0}
+        # Shared by every call on this client, so concurrent callers stay within one quota
+        self.request_bucket = _bucket(requests_per_minute)
+        self.token_bucket = _bucket(tokens_per_minute)
+        self._semaphores = weakref.WeakKeyDictionary()
+
+    async def aembed(self, texts):
+        """
+        Embed texts concurrently.
+
+        Args:
+            texts (list): Texts to embed.
+
+        Returns:
+            list: One vector per text, aligned with the input; None where a
+            batch still failed after all retries.
+        """
+        # asyncio semaphores belong to one event loop, so the concurrency limit
+        # is kept per loop; the rate limits are shared across loops.
+        loop = asyncio.get_running_loop()
+        semaphore = self._semaphores.get(loop)
+        if semaphore is None:
+            semaphore = self._semaphores[loop] = asyncio.Semaphore(self.max_concurrency)
+        embeddings = [None] * len(texts)
+
+        async def run(indices):
+            batch = [texts[i] for i in indices]
+            async with semaphore:
+                vectors = await self._send(batch)
+            if vectors is not None:
+                for i, vector in zip(indices, vectors):
+                    embeddings[i] = vector
+
+        batches = pack_batches(texts, self.max_batch_size, self.max_batch_tokens, self.count_tokens)
+        await asyncio.gather(*(run(indices) for indices in batches))
+        return embeddings
+
+    def embed(self, texts):
+        """Blocking wrapper around aembed(), safe to call with or without a running event loop."""
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            return asyncio.run(self.aembed(texts))
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            return executor.submit(asyncio.run, self.aembed(texts)).result()
+
+    async def _send(self, batch):
+        for attempt in range(self.max_retries + 1):
+            if self.request_bucket:
+                await self.request_bucket.acquire(1)
+            if self.token_bucket:
+                await self.token_bucket.acquire(sum(self.count_tokens(text) for text in batch))
+            self.stats["requests"] += 1
+            try:
+                if inspect.iscoroutinefunction(self.embed_batch):
+                    return await self.embed_batch(batch)
+                return await asyncio.to_thread(self.embed_batch, batch)
+            except Exception as e:
+                if attempt == self.max_retries or not is_retryable(e):
+                    print(f"Error generating embeddings for a batch of {len(batch)} chunks: {e}")
+                    self.stats["failed_batches"] += 1
+                    return None
+                delay = min(self.max_delay, self.base_delay * 2 ** attempt) * random.uniform(0.5, 1.0)
+                self.stats["retries"] += 1
+                await asyncio.sleep(delay)
+
+
+def _bucket(per_minute):
+    if per_minute <= 0:
+        return None
+    # Allow a burst of up to one second's worth of quota.
+    return TokenBucket(per_minute / 60.0, max(1.0, per_minute / 60.0))
@@ -1,6 +1,6 @@
 import os
-from PyPDF2 import PdfReader
-from langchain.text_splitter import CharacterTextSplitter
+from data_reader import iter_pdf_pages, iter_text_chunks
+from chroma_ingest import upsert_chunks
 from chromadb import Client
 from chromadb.config import Settings
 from vertexai.preview.language_models import TextGenerationModel
@@ -22,11 +22,7 @@ PDF_FILES = {
 }
 
 def process_pdf(file_path):
-    reader = PdfReader(file_path)
-    text = ""
-    for page in reader.pages:
-        text += page.extract_text()
-    return text
+    return "".join(iter_pdf_pages(file_path))
 
 def generate_embeddings(chunks):
     embeddings = []
@@ -35,10 +31,10 @@ def generate_embeddings(chunks):
         embeddings.append(response.text_embedding)
     return embeddings
 
-def store_embeddings_in_chroma(bucket_name, chunks, embeddings):
-    collection = client.create_collection(bucket_name)
-    for i, chunk in enumerate(chunks):
-        collection.add(f"doc-{i}", chunk, embeddings[i])
+def store_embeddings_in_chroma(bucket_name, chunks):
+    # Content-hashed ids make re-runs upsert in place; only new chunks are embedded
+    collection = client.get_or_create_collection(bucket_name)
+    upsert_chunks(collection, chunks, generate_embeddings)
 
 def interactive_chat(bucket_name):
     collection = client.get_collection(bucket_name)
@@ -55,10 +51,9 @@ def interactive_chat(bucket_name):
 def main():
     for bucket, file_path in PDF_FILES.items():
         if os.path.exists(file_path):
-            text = process_pdf(file_path)
-            chunks = CharacterTextSplitter().split_text(text)
-            embeddings = generate_embeddings(chunks)
-            store_embeddings_in_chroma(bucket, chunks, embeddings)
+            # CharacterTextSplitter defaults: 4000-character chunks, 200 overlap
+            chunks = list(iter_text_chunks(iter_pdf_pages(file_path), 4000, 200))
+            store_embeddings_in_chroma(bucket, chunks)
 
     while True:
         print("\nBuckets Available:", list(PDF_FILES.keys()))
@@ -1,6 +1,10 @@
 import os
 from PyPDF2 import PdfReader
 from langchain.text_splitter import CharacterTextSplitter
+from ingestion import INGESTION_WORKERS, chunk_all_pdfs
+from ingestion_manifest import IngestionManifest
+from embedding_cache import default_query_cache
+from chroma_ingest import upsert_chunks
 from chromadb import Client
 from chromadb.config import Settings
 from vertexai.preview.language_models import TextGenerationModel
@@ -8,7 +12,8 @@ from vertexai.preview.language_models import TextGenerationModel
 # Initialize Vertex AI
 import vertexai
 vertexai.init(project="playpen-33fcd2", location="europe-central12")
-GENAI_MODEL = TextGenerationModel.from_pretrained("text-bison@001")
+GENAI_MODEL_NAME = "text-bison@001"
+GENAI_MODEL = TextGenerationModel.from_pretrained(GENAI_MODEL_NAME)
 
 # Path to PDF folder
 PDF_FOLDER = "./pdfs"
@@ -33,10 +38,7 @@ def read_pdf(pdf_path):
     """Read and extract text from a PDF file."""
     try:
         reader = PdfReader(pdf_path)
-        pdf_text = ""
-        for page in reader.pages:
-            pdf_text += page.extract_text()
-        return pdf_text
+        return "".join(page.extract_text() for page in reader.pages)
     except Exception as e:
         print(f"Error reading PDF file {pdf_path}: {e}")
         return ""
@@ -47,7 +49,7 @@ def split_text_into_chunks(text, chunk_size=300, chunk_overlap=100):
     return text_splitter.split_text(text)
 
 def generate_embeddings(chunks):
-    """Generate embeddings using Vertex AI."""
+    """Generate embeddings using Vertex AI; a chunk that fails gets None so the list stays aligned."""
     embeddings = []
     for chunk in chunks:
         try:
@@ -56,27 +58,40 @@ def generate_embeddings(chunks):
             embeddings.append(embedding)
         except Exception as e:
             print(f"Error generating embedding for chunk: {e}")
+            embeddings.append(None)
     return embeddings
 
-def create_vector_store_in_chroma(store_name, chunks, embeddings):
+def create_vector_store_in_chroma(store_name, chunks):
     """
-    Store embeddings into ChromaDB.
+    Embed and store chunks into ChromaDB.
+
+    Records are keyed by a hash of their text and upserted in batches;
+    chunks already in the collection are not embedded again, and records
+    for text that is gone are removed.
 
     Args:
         store_name (str): Name of the bucket.
         chunks (list): List of text chunks.
-        embeddings (list): Embeddings for the chunks.
 
     Returns:
-        None
+        bool: True if every chunk was stored.
     """
     try:
         collection = chroma_client.get_or_create_collection(name=store_name)
-        for chunk, embedding in zip(chunks, embeddings):
-            collection.add(documents=[chunk], embeddings=[embedding])
+        stats = upsert_chunks(collection, chunks, generate_embeddings)
         print(f"Data stored successfully in ChromaDB for {store_name}.")
+        return stats["failed"] == 0
     except Exception as e:
         print(f"Error storing data in ChromaDB: {e}")
+        return False
+
+def delete_vectors_from_chroma(store_name):
+    """Remove a bucket's collection, if it exists, before re-ingesting or after its file was deleted."""
+    try:
+        chroma_client.delete_collection(name=store_name)
+        print(f"Removed existing ChromaDB data for {store_name}.")
+    except Exception:
+        pass
 
 def retrieve_from_chroma(store_name, query_embedding, top_k=5):
     """
@@ -99,27 +114,25 @@ def retrieve_from_chroma(store_name, query_embedding, top_k=5):
         return []
 
 ### Main Functions ###
-def process_all_pdfs():
+def process_all_pdfs(max_workers=INGESTION_WORKERS):
     """
     Process all PDFs and store them in ChromaDB.
+
+    PDF extraction and chunking run in a process pool, one task per bucket;
+    embedding and storage happen here as each bucket finishes. Buckets whose
+    file is unchanged since the last run are skipped, and the collections of
+    deleted files are dropped.
     """
     print("\nProcessing all PDFs and storing data in ChromaDB...")
 
-    for store_name, pdf_path in PDF_FILES.items():
-        print(f"\nProcessing '{store_name}' bucket...")
-
-        if not validate_file_path(pdf_path):
-            print(f"Skipping '{store_name}' bucket due to missing file.")
-            continue
-
-        pdf_text = read_pdf(pdf_path)
-        if not pdf_text:
-            print(f"Skipping '{store_name}' bucket due to empty content in {pdf_path}.")
-            continue
+    manifest = IngestionManifest("chroma", params={"embedding_model": GENAI_MODEL_NAME})
+    for store_name in manifest.removed_buckets(PDF_FILES):
+        delete_vectors_from_chroma(store_name)
+        manifest.forget(store_name)
 
-        text_chunks = split_text_into_chunks(pdf_text)
-        embeddings = generate_embeddings(text_chunks)
-        create_vector_store_in_chroma(store_name, text_chunks, embeddings)
+    for store_name, text_chunks in chunk_all_pdfs(PDF_FILES, max_workers, manifest=manifest):
+        if create_vector_store_in_chroma(store_name, text_chunks):
+            manifest.record(store_name)
 
     print("\nAll PDFs have been processed and stored successfully.")
 
@@ -149,7 +162,9 @@ def interactive_chat():
                 print("Returning to bucket selection...")
                 break
 
-            query_embedding = GENAI_MODEL.predict(query).text_embedding  # Adjust attribute if needed
+            query_embedding = default_query_cache().embed_query(
+                GENAI_MODEL_NAME, query, lambda text: GENAI_MODEL.predict(text).text_embedding  # Adjust attribute if needed
+            )
             results = retrieve_from_chroma(selected_bucket, query_embedding)
 
             if not results:
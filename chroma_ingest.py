@@ -0,0 +1,86 @@
+import hashlib
+import os
+import time
+
+# Chunks embedded and written per upsert call; Chroma rejects batches above
+# its server limit (about 5461 on SQLite-backed clients)
+CHROMA_UPSERT_BATCH_SIZE = int(os.environ.get("CHROMA_UPSERT_BATCH_SIZE", "5000"))
+
+
+def chunk_id(text):
+    """Deterministic id derived from a chunk's content, so re-ingesting the same text hits the same record."""
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()[:32]
+
+
+def existing_ids(collection, ids, batch_size=CHROMA_UPSERT_BATCH_SIZE):
+    """Subset of ids already stored in the collection."""
+    found = set()
+    for start in range(0, len(ids), batch_size):
+        found.update(collection.get(ids=ids[start:start + batch_size], include=[])["ids"])
+    return found
+
+
+def upsert_chunks(collection, chunks, embed_fn, batch_size=CHROMA_UPSERT_BATCH_SIZE, prune=True):
+    """
+    Idempotently sync a collection with a list of text chunks.
+
+    Chunks whose content id is already in the collection are skipped
+    before embedding, so a re-run only pays for new text. The rest are
+    embedded and upserted ``batch_size`` at a time. With ``prune``, records
+    whose chunk no longer appears in ``chunks`` are deleted.
+
+    Args:
+        collection: Chroma collection.
+        chunks (list): Text chunks.
+        embed_fn (callable): Takes a list of texts and returns one vector
+            (or None on failure) per text.
+        batch_size (int): Chunks per embedding call and upsert.
+        prune (bool): Delete records not in ``chunks``.
+
+    Returns:
+        dict: Counts of added, skipped, failed and pruned chunks, and timings.
+    """
+    unique = {}
+    for chunk in chunks:
+        unique.setdefault(chunk_id(chunk), chunk)
+    ids = list(unique)
+    present = existing_ids(collection, ids, batch_size)
+    missing = [i for i in ids if i not in present]
+
+    stats = {"added": 0, "skipped": len(ids) - len(missing), "failed": 0, "pruned": 0,
+             "embed_seconds": 0.0, "write_seconds": 0.0}
+    for start in range(0, len(missing), batch_size):
+        batch_ids = missing[start:start + batch_size]
+        texts = [unique[i] for i in batch_ids]
+
+        started = time.perf_counter()
+        vectors = embed_fn(texts)
+        stats["embed_seconds"] += time.perf_counter() - started
+
+        rows = [(i, text, vector) for i, text, vector in zip(batch_ids, texts, vectors) if vector is not None]
+        stats["failed"] += len(batch_ids) - len(rows)
+        if not rows:
+            continue
+        started = time.perf_counter()
+        collection.upsert(
+            ids=[i for i, _, _ in rows],
+            documents=[text for _, text, _ in rows],
+            embeddings=[list(vector) for _, _, vector in rows],
+        )
+        stats["write_seconds"] += time.perf_counter() - started
+        stats["added"] += len(rows)
+
+    if prune:
+        stale = [i for i in collection.get(include=[])["ids"] if i not in unique]
+        for start in range(0, len(stale), batch_size):
+            collection.delete(ids=stale[start:start + batch_size])
+        stats["pruned"] = len(stale)
+
+    total = stats["embed_seconds"] + stats["write_seconds"]
+    rate = stats["added"] / total if total else 0.0
+    print(
+        f"'{collection.name}': {stats['added']} added, {stats['skipped']} unchanged, "
+        f"{stats['failed']} failed, {stats['pruned']} removed; "
+        f"embed {stats['embed_seconds']:.1f}s, write {stats['write_seconds']:.1f}s ({rate:.0f} chunks/s)."
+    )
+    return stats
@@ -0,0 +1,95 @@
+import json
+import os
+import numpy as np
+
+# Per-chunk columns, all little-endian uint32: 24 bytes per chunk
+COLUMNS = ("doc_id", "page", "char_start", "char_end", "token_start", "token_end")
+METADATA_FILE = "chunk_metadata.json"
+
+
+class ChunkMetadata:
+    """
+    Columnar provenance for the rows of a VectorIndex.
+
+    Each column is one uint32 array aligned with the index rows: document id,
+    1-based page number, and the chunk's character and token offsets within
+    its page. Document names are stored once in a small table and referenced
+    by id, so a chunk costs a fixed 24 bytes however long its source path is.
+    Saved columns are memory-mapped back like the embeddings. Like the
+    VectorIndex matrix, the columns grow geometrically, so appending one
+    batch at a time stays amortized O(n).
+    """
+
+    def __init__(self, documents=None, columns=None):
+        self.documents = list(documents or [])
+        self._columns = columns or {name: np.empty(0, dtype="<u4") for name in COLUMNS}
+        self._size = len(self._columns["doc_id"])
+        self._document_ids = {name: i for i, name in enumerate(self.documents)}
+
+    def __len__(self):
+        return self._size
+
+    @property
+    def columns(self):
+        """Column name -> uint32 array of the stored rows, without spare capacity."""
+        return {name: column[:self._size] for name, column in self._columns.items()}
+
+    def document_id(self, document):
+        if document not in self._document_ids:
+            self._document_ids[document] = len(self.documents)
+            self.documents.append(document)
+        return self._document_ids[document]
+
+    def extend(self, sources):
+        """
+        Append rows.
+
+        Args:
+            sources (list): (document, page, char_start, char_end, token_start, token_end) per chunk.
+        """
+        if not sources:
+            return
+        rows = np.array(
+            [(self.document_id(document), *offsets) for document, *offsets in sources], dtype="<u4"
+        ).reshape(len(sources), len(COLUMNS))
+        needed = self._size + len(rows)
+        for j, name in enumerate(COLUMNS):
+            column = self._columns[name]
+            if needed > len(column):
+                grown = np.empty(max(needed, 2 * len(column)), dtype="<u4")
+                grown[:self._size] = column[:self._size]
+                self._columns[name] = column = grown
+            column[self._size:needed] = rows[:, j]
+        self._size = needed
+
+    def get(self, row):
+        """Metadata of one row as a dict, e.g. for a citation."""
+        values = {name: int(self._columns[name][row]) for name in COLUMNS}
+        return {
+            "document": self.documents[values.pop("doc_id")],
+            **values,
+        }
+
+    def nbytes(self):
+        return sum(column.nbytes for column in self.columns.values())
+
+    def save(self, directory):
+        for name in COLUMNS:
+            np.ascontiguousarray(self.columns[name], dtype="<u4").tofile(os.path.join(directory, f"{name}.u32"))
+        with open(os.path.join(directory, METADATA_FILE), "w", encoding="utf-8") as f:
+            json.dump({"columns": list(COLUMNS), "documents": self.documents}, f)
+
+    @classmethod
+    def load(cls, directory, count):
+        """Memory-map the columns saved in a directory, or return None if it has no metadata."""
+        path = os.path.join(directory, METADATA_FILE)
+        if not os.path.exists(path):
+            return None
+        with open(path, "r", encoding="utf-8") as f:
+            header = json.load(f)
+        columns = {
+            name: np.memmap(os.path.join(directory, f"{name}.u32"), dtype="<u4", mode="r", shape=(count,))
+            if count else np.empty(0, dtype="<u4")
+            for name in header["columns"]
+        }
+        return cls(header["documents"], columns)
@@ -1,17 +1,179 @@
+import os
+import re
+from bisect import bisect_left
 from PyPDF2 import PdfReader
 from langchain.text_splitter import CharacterTextSplitter
 
+# Default chunk length and overlap, in tokens, for the token-based splitter
+TOKEN_CHUNK_SIZE = int(os.environ.get("TOKEN_CHUNK_SIZE", "256"))
+TOKEN_CHUNK_OVERLAP = int(os.environ.get("TOKEN_CHUNK_OVERLAP", "32"))
+
+# End of a sentence (punctuation and optional closing quote/bracket, before whitespace) or
+# a blank line. The whitespace is left out because tokenizers attach it to the next token.
+_SENTENCE_END = re.compile(r"[.!?][\"')\]]*(?=\s)|\n(?=\s*\n)")
+
+_default_encoder = None
+
+
+def iter_pdf_pages(pdf_path):
+    """Yield the extracted text of each page, one page at a time."""
+    reader = PdfReader(pdf_path)
+    for page in reader.pages:
+        yield page.extract_text() or ""
+
+
+def iter_text_chunks(pages, chunk_size=300, chunk_overlap=100):
+    """
+    Split a stream of page texts into chunks without joining the whole document.
+
+    Only the current page plus the last, possibly unfinished, chunk of the
+    previous pages are held at once. That trailing chunk is carried into the
+    next page so chunks can still span page boundaries.
+
+    Args:
+        pages (iterable): Page texts, e.g. from iter_pdf_pages().
+        chunk_size (int): Size of each chunk.
+        chunk_overlap (int): Overlap between consecutive chunks.
+
+    Yields:
+        str: Text chunks in document order.
+    """
+    text_splitter = CharacterTextSplitter(chunk_size=chunk_size, chunk_overlap=chunk_overlap)
+    carry = ""
+    for page_text in pages:
+        chunks = text_splitter.split_text(carry + page_text)
+        if not chunks:
+            carry = ""
+            continue
+        yield from chunks[:-1]
+        carry = chunks[-1]
+        # A piece the splitter could not break up would otherwise grow with
+        # every page; emit it now to keep the carried window bounded.
+        if len(carry) > chunk_size:
+            yield carry
+            carry = ""
+    if carry:
+        yield carry
+
+
+def default_encoder():
+    """
+    tiktoken's cl100k_base encoder (the GPT-4 / text-embedding tokenizer), or None if unavailable.
+    """
+    global _default_encoder
+    if _default_encoder is None:
+        try:
+            import tiktoken
+            _default_encoder = tiktoken.get_encoding("cl100k_base")
+        except Exception as e:
+            print(f"Token splitter unavailable, using character chunks: {e}")
+            _default_encoder = False
+    return _default_encoder or None
+
+
+def split_text_by_tokens(text, encoder, chunk_tokens=TOKEN_CHUNK_SIZE, overlap_tokens=TOKEN_CHUNK_OVERLAP):
+    """
+    Split text into chunks of at most ``chunk_tokens`` tokens; see token_spans().
+
+    Returns:
+        list: (chunk text, token count) pairs.
+    """
+    return [(chunk, token_end - token_start)
+            for chunk, _, _, token_start, token_end in token_spans(text, encoder, chunk_tokens, overlap_tokens)]
+
+
+def token_spans(text, encoder, chunk_tokens=TOKEN_CHUNK_SIZE, overlap_tokens=TOKEN_CHUNK_OVERLAP):
+    """
+    Split text into chunks of at most ``chunk_tokens`` tokens, keeping their offsets.
+
+    The text is encoded once; chunks are cut on token offsets and pulled
+    back to the last sentence end in the second half of the window, so
+    they rarely stop mid-sentence. Consecutive chunks share
+    ``overlap_tokens`` tokens.
+
+    Args:
+        text (str): Text to split, e.g. one page.
+        encoder: tiktoken Encoding (needs encode() and decode_with_offsets()).
+        chunk_tokens (int): Maximum tokens per chunk.
+        overlap_tokens (int): Tokens repeated at the start of the next chunk.
+
+    Returns:
+        list: (chunk text, char start, char end, token start, token end)
+        tuples; offsets are relative to ``text`` and end-exclusive.
+    """
+    tokens = encoder.encode(text, disallowed_special=())
+    if not tokens:
+        return []
+    decoded, offsets = encoder.decode_with_offsets(tokens)
+    offsets = list(offsets) + [len(decoded)]
+    total = len(tokens)
+    min_tokens = max(1, chunk_tokens // 2)
+
+    chunks = []
+    start = covered = 0
+    while True:
+        end = min(start + chunk_tokens, total)
+        if end < total:
+            window_start = offsets[start + min_tokens]
+            boundary = None
+            for match in _SENTENCE_END.finditer(decoded, window_start, offsets[end]):
+                boundary = match.end()
+            if boundary is not None:
+                snapped = bisect_left(offsets, boundary, start + min_tokens, end)
+                if start < snapped <= end:
+                    end = snapped
+        # Skip a chunk that would only repeat the overlap plus whitespace
+        if decoded[offsets[max(start, covered)]:offsets[end]].strip():
+            chunks.append((decoded[offsets[start]:offsets[end]], offsets[start], offsets[end], start, end))
+        covered = end
+        if end >= total:
+            return chunks
+        start = max(end - overlap_tokens, start + 1)
+
+
+def iter_token_chunks(pages, encoder, chunk_tokens=TOKEN_CHUNK_SIZE, overlap_tokens=TOKEN_CHUNK_OVERLAP):
+    """
+    Token-based counterpart of iter_text_chunks(); chunks stay within a page.
+
+    Yields:
+        tuple: (chunk text, token count) in document order.
+    """
+    for page_text in pages:
+        yield from split_text_by_tokens(page_text, encoder, chunk_tokens, overlap_tokens)
+
+
+def iter_page_chunks(pages, encoder, chunk_tokens=TOKEN_CHUNK_SIZE, overlap_tokens=TOKEN_CHUNK_OVERLAP):
+    """
+    Like iter_token_chunks(), but with each chunk's location in the document.
+
+    Yields:
+        tuple: (chunk text, page number, char start, char end, token start,
+        token end); pages are numbered from 1, offsets are within the page.
+    """
+    for page_number, page_text in enumerate(pages, start=1):
+        for chunk, *offsets in token_spans(page_text, encoder, chunk_tokens, overlap_tokens):
+            yield (chunk, page_number, *offsets)
+
+
 class DataReader:
     def __init__(self, pdf_path):
         self.pdf_path = pdf_path
 
+    def iter_pages(self):
+        return iter_pdf_pages(self.pdf_path)
+
     def read_pdf(self):
-        reader = PdfReader(self.pdf_path)
-        pdf_text = ""
-        for page in reader.pages:
-            pdf_text += page.extract_text()
-        return pdf_text
+        return "".join(self.iter_pages())
 
     def split_text_into_chunks(self, text, chunk_size=300, chunk_overlap=100):
         text_splitter = CharacterTextSplitter(chunk_size=chunk_size, chunk_overlap=chunk_overlap)
         return text_splitter.split_text(text)
+
+    def iter_chunks(self, chunk_size=300, chunk_overlap=100):
+        return iter_text_chunks(self.iter_pages(), chunk_size, chunk_overlap)
+
+    def iter_token_chunks(self, encoder, chunk_tokens=TOKEN_CHUNK_SIZE, overlap_tokens=TOKEN_CHUNK_OVERLAP):
+        return iter_token_chunks(self.iter_pages(), encoder, chunk_tokens, overlap_tokens)
+
+    def iter_page_chunks(self, encoder, chunk_tokens=TOKEN_CHUNK_SIZE, overlap_tokens=TOKEN_CHUNK_OVERLAP):
+        return iter_page_chunks(self.iter_pages(), encoder, chunk_tokens, overlap_tokens)
@@ -0,0 +1,117 @@
+import hashlib
+import os
+import numpy as np
+
+# Chunks whose 64-bit SimHash fingerprints differ in at most this many bits
+# are treated as duplicates; -1 disables chunk deduplication
+CHUNK_DEDUP_DISTANCE = int(os.environ.get("CHUNK_DEDUP_DISTANCE", "3"))
+
+# Words per shingle hashed into a fingerprint
+SIMHASH_SHINGLE_WORDS = int(os.environ.get("SIMHASH_SHINGLE_WORDS", "3"))
+
+FINGERPRINT_BITS = 64
+
+
+def simhash(text, shingle_words=SIMHASH_SHINGLE_WORDS):
+    """
+    64-bit SimHash of a text's word shingles.
+
+    Case and whitespace are ignored, and texts that share most of their
+    shingles get fingerprints that differ in only a few bits.
+
+    Args:
+        text (str): Text to fingerprint.
+        shingle_words (int): Words per shingle.
+
+    Returns:
+        int: The fingerprint.
+    """
+    words = text.lower().split()
+    if not words:
+        return 0
+    shingles = {" ".join(words[i:i + shingle_words]) for i in range(max(1, len(words) - shingle_words + 1))}
+    hashes = np.frombuffer(
+        b"".join(hashlib.blake2b(shingle.encode("utf-8"), digest_size=8).digest() for shingle in shingles),
+        dtype=np.uint8,
+    ).reshape(len(shingles), 8)
+    # Each bit of the fingerprint is the majority vote of that bit across shingle hashes
+    votes = np.unpackbits(hashes, axis=1, bitorder="little").sum(axis=0) * 2 > len(shingles)
+    return int.from_bytes(np.packbits(votes, bitorder="little").tobytes(), "little")
+
+
+class SimHashIndex:
+    """
+    Near-duplicate lookup over SimHash fingerprints.
+
+    The 64 bits are split into ``max_distance + 1`` bands; two fingerprints
+    within ``max_distance`` bits of each other agree exactly on at least one
+    band, so only fingerprints sharing a band are compared.
+    """
+
+    def __init__(self, max_distance=CHUNK_DEDUP_DISTANCE):
+        self.max_distance = max_distance
+        bands = max_distance + 1
+        widths = [FINGERPRINT_BITS // bands + (1 if b < FINGERPRINT_BITS % bands else 0) for b in range(bands)]
+        self._bands = []
+        shift = 0
+        for width in widths:
+            self._bands.append((shift, (1 << width) - 1))
+            shift += width
+        self._tables = [{} for _ in self._bands]
+        self.fingerprints = []
+
+    def __len__(self):
+        return len(self.fingerprints)
+
+    def find(self, fingerprint):
+        """Row of the first stored fingerprint within ``max_distance`` bits, or None."""
+        for table, (shift, mask) in zip(self._tables, self._bands):
+            for row in table.get((fingerprint >> shift) & mask, ()):
+                if bin(fingerprint ^ self.fingerprints[row]).count("1") <= self.max_distance:
+                    return row
+        return None
+
+    def add(self, fingerprint):
+        row = len(self.fingerprints)
+        self.fingerprints.append(fingerprint)
+        for table, (shift, mask) in zip(self._tables, self._bands):
+            table.setdefault((fingerprint >> shift) & mask, []).append(row)
+        return row
+
+
+class DuplicateFilter:
+    """
+    Streaming form of dedupe_chunks(): remembers the fingerprints of the
+    chunks kept so far, so chunks can be checked one batch at a time.
+    """
+
+    def __init__(self, max_distance=CHUNK_DEDUP_DISTANCE):
+        self.index = SimHashIndex(max_distance) if max_distance >= 0 else None
+        self.dropped = 0
+
+    def keep(self, chunk):
+        """True if ``chunk`` does not repeat a chunk kept earlier; it is then remembered."""
+        if self.index is None:
+            return True
+        fingerprint = simhash(chunk)
+        if self.index.find(fingerprint) is not None:
+            self.dropped += 1
+            return False
+        self.index.add(fingerprint)
+        return True
+
+
+def dedupe_chunks(chunks, max_distance=CHUNK_DEDUP_DISTANCE):
+    """
+    Drop chunks that repeat (or nearly repeat) an earlier chunk.
+
+    Args:
+        chunks (list): Text chunks in document order.
+        max_distance (int): SimHash bit distance counted as a duplicate;
+            0 only drops chunks with identical shingles, -1 keeps everything.
+
+    Returns:
+        list: Indexes of the chunks to keep, in order.
+    """
+    duplicates = DuplicateFilter(max_distance)
+    return [i for i, chunk in enumerate(chunks) if duplicates.keep(chunk)]
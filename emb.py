@@ -1,12 +1,21 @@
 import os
 from PyPDF2 import PdfReader
 from langchain.text_splitter import CharacterTextSplitter
+from ingestion import INGESTION_WORKERS, stream_all_pdfs
+from embedding_cache import default_cache, default_query_cache
+from async_embedding import AsyncEmbeddingClient
+from vector_index import VectorIndex
+from mmap_store import load_index, remove_index, save_index
+from rerank import MMR_FETCH_K, merge_adjacent, mmr_rerank
+from ingestion_manifest import IngestionManifest
 from google.cloud import aiplatform
 from vertexai.preview.language_models import TextEmbeddingModel
 
 # Initialize Vertex AI
 aiplatform.init(project="playpen-33fcd2", location="europe-central12")
-MODEL = TextEmbeddingModel.from_pretrained("textembedding-gecko@003")
+MODEL_NAME = "textembedding-gecko@003"
+MODEL = TextEmbeddingModel.from_pretrained(MODEL_NAME)
+EMBEDDING_CLIENT = AsyncEmbeddingClient(lambda batch: MODEL.get_embeddings(batch).embeddings)
 
 # Path to PDF folder
 PDF_FOLDER = "./pdfs"
@@ -16,7 +25,10 @@ PDF_FILES = {
     "platform_engineer": os.path.join(PDF_FOLDER, "Platform_Engineer.pdf"),
 }
 
-# Temporary in-memory store for embeddings
+# Memory-mapped copies of each bucket's index, reused across restarts
+STORE_DIR = "./embeddings_stores"
+
+# In-memory store of one VectorIndex per bucket
 EMBEDDINGS_STORE = {}
 
 # Utility Functions
@@ -31,10 +43,7 @@ def read_pdf(pdf_path):
     """Read and extract text from a PDF file."""
     try:
         reader = PdfReader(pdf_path)
-        pdf_text = ""
-        for page in reader.pages:
-            pdf_text += page.extract_text()
-        return pdf_text
+        return "".join(page.extract_text() for page in reader.pages)
     except Exception as e:
         print(f"Error reading PDF file {pdf_path}: {e}")
         return ""
@@ -45,42 +54,53 @@ def split_text_into_chunks(text, chunk_size=300, chunk_overlap=100):
     return text_splitter.split_text(text)
 
 def generate_embeddings(chunks):
-    """Generate embeddings using Vertex AI."""
-    embeddings = []
-    for chunk in chunks:
-        try:
-            response = MODEL.get_embeddings([chunk])
-            embeddings.append(response.embeddings[0])
-        except Exception as e:
-            print(f"Error generating embedding for chunk: {e}")
-    return embeddings
-
-def process_all_pdfs():
+    """Generate embeddings using Vertex AI, reusing cached vectors (None where embedding failed)."""
+    return default_cache().embed(MODEL_NAME, chunks, _embed_chunks)
+
+def _embed_chunks(chunks):
+    """Embed chunks in batched requests, several in flight within the rate limits."""
+    return EMBEDDING_CLIENT.embed(chunks)
+
+def process_all_pdfs(max_workers=INGESTION_WORKERS):
     """
     Process all PDFs and store their embeddings in the in-memory store.
+
+    PDF extraction and chunking run in a process pool, one task per bucket;
+    embedding happens here as each bucket finishes. Each bucket is saved
+    under STORE_DIR and memory-mapped back on later runs while its file is
+    unchanged.
     """
     print("\nProcessing all PDFs and generating embeddings...")
 
-    for store_name, pdf_path in PDF_FILES.items():
-        print(f"\nProcessing '{store_name}' bucket...")
-
-        if not validate_file_path(pdf_path):
-            print(f"Skipping '{store_name}' bucket due to missing file.")
-            continue
-
-        pdf_text = read_pdf(pdf_path)
-        if not pdf_text:
-            print(f"Skipping '{store_name}' bucket due to empty content in {pdf_path}.")
-            continue
-
-        text_chunks = split_text_into_chunks(pdf_text)
-        embeddings = generate_embeddings(text_chunks)
-
-        # Store in in-memory dictionary
-        EMBEDDINGS_STORE[store_name] = {
-            "chunks": text_chunks,
-            "embeddings": embeddings,
-        }
+    manifest = IngestionManifest("emb", params={"embedding_model": MODEL_NAME})
+    for store_name in manifest.removed_buckets(PDF_FILES):
+        remove_index(os.path.join(STORE_DIR, store_name))
+        manifest.forget(store_name)
+    for store_name in PDF_FILES:
+        if not os.path.exists(os.path.join(STORE_DIR, store_name)):
+            manifest.forget(store_name)
+
+    for store_name, batches in stream_all_pdfs(PDF_FILES, max_workers, manifest=manifest):
+        # Embed one batch at a time into an in-memory index, then persist it
+        index = VectorIndex()
+        missing = 0
+        for text_chunks, sources in batches:
+            embeddings = generate_embeddings(text_chunks)
+            missing += sum(embedding is None for embedding in embeddings)
+            index.add(text_chunks, embeddings, sources=sources)
+        index.build_lexical()
+        save_index(os.path.join(STORE_DIR, store_name), index, {"embedding_model": MODEL_NAME})
+        if missing:
+            # Leave the bucket unrecorded so the next run retries the missing chunks
+            print(f"{missing} chunks of '{store_name}' have no embedding; they will be retried on the next run.")
+        else:
+            manifest.record(store_name)
+        EMBEDDINGS_STORE[store_name] = index
+
+    # Buckets skipped as unchanged are served straight from disk
+    for store_name in PDF_FILES:
+        if store_name not in EMBEDDINGS_STORE and store_name in manifest.entries:
+            EMBEDDINGS_STORE[store_name] = load_index(os.path.join(STORE_DIR, store_name))
 
     print("\nAll PDFs have been processed and embeddings generated successfully.")
 
@@ -110,24 +130,25 @@ def interactive_chat():
                 print("Returning to bucket selection...")
                 break
 
+            store = EMBEDDINGS_STORE[selected_bucket]
             try:
                 # Generate query embedding
-                query_embedding = MODEL.get_embeddings([query]).embeddings[0]
-
-                # Retrieve relevant chunks
-                store = EMBEDDINGS_STORE[selected_bucket]
-                chunks = store["chunks"]
-                embeddings = store["embeddings"]
-
-                # Calculate similarity (cosine similarity placeholder)
-                similarities = [
-                    sum(qe * ce for qe, ce in zip(query_embedding, chunk_emb))
-                    for chunk_emb in embeddings
-                ]
-
-                # Get top results
-                top_indices = sorted(range(len(similarities)), key=lambda i: similarities[i], reverse=True)[:5]
-                top_results = [chunks[i] for i in top_indices]
+                query_embedding = default_query_cache().embed_query(
+                    MODEL_NAME, query, lambda text: MODEL.get_embeddings([text]).embeddings[0]
+                )
+            except Exception as e:
+                # Keyword search still works while the embedding service is down
+                print(f"Error generating query embedding, using keyword search: {e}")
+                query_embedding = None
+
+            try:
+                # Retrieve the top chunks by cosine similarity fused with BM25, diversified
+                # by MMR and with overlapping chunks joined
+                if query_embedding is None:
+                    hits = store.search_lexical(query, MMR_FETCH_K)
+                else:
+                    hits = store.search_hybrid(query_embedding, query, MMR_FETCH_K)
+                top_results = [text for _, text, _ in merge_adjacent(store, mmr_rerank(store, hits, 5))]
 
                 print("\nTop Results:")
                 for result in top_results:
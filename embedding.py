@@ -1,8 +1,50 @@
+from langchain_core.embeddings import Embeddings
 from langchain_community.embeddings import OpenAIEmbeddings
+from embedding_cache import default_cache, default_query_cache
+from async_embedding import AsyncEmbeddingClient
+
+# OpenAI embedding request limits
+OPENAI_MAX_BATCH_SIZE = 2048
+OPENAI_MAX_BATCH_TOKENS = 300000
+
+class CachedEmbeddings(Embeddings):
+    """
+    Wraps a LangChain embeddings object so document embeddings go through the
+    shared on-disk cache, with misses packed into token-budgeted requests that
+    are sent concurrently by an AsyncEmbeddingClient. Query embeddings go
+    through the in-process query cache.
+    """
+
+    def __init__(self, embeddings, model_name, cache=None, query_cache=None, count_tokens=None,
+                 max_batch_size=OPENAI_MAX_BATCH_SIZE, max_batch_tokens=OPENAI_MAX_BATCH_TOKENS):
+        self.embeddings = embeddings
+        self.model = model_name
+        self.cache = cache or default_cache()
+        self.query_cache = query_cache or default_query_cache()
+        self.client = AsyncEmbeddingClient(
+            embeddings.embed_documents,
+            max_batch_size=max_batch_size,
+            max_batch_tokens=max_batch_tokens,
+            count_tokens=count_tokens,
+        )
+
+    def embed_documents(self, texts):
+        return self.cache.embed(self.model, texts, self.client.embed)
+
+    def embed_query(self, text):
+        return self.query_cache.embed_query(self.model, text, self.embeddings.embed_query)
+
+    async def aembed_query(self, text):
+        return await self.query_cache.aembed_query(self.model, text, self.embeddings.aembed_query)
+
+    async def aembed_queries(self, texts):
+        """Embed several questions in one request, reusing cached query embeddings."""
+        return await self.query_cache.aembed_queries(self.model, texts, self.embeddings.aembed_documents)
 
 class EmbeddingsGenerator:
     def __init__(self):
-        self.embeddings = OpenAIEmbeddings()
+        openai_embeddings = OpenAIEmbeddings(chunk_size=OPENAI_MAX_BATCH_SIZE)
+        self.embeddings = CachedEmbeddings(openai_embeddings, openai_embeddings.model)
 
     def generate_embeddings(self, docs):
         return self.embeddings.embed_documents(docs)
@@ -0,0 +1,60 @@
+import os
+
+# Vertex AI text embedding request limits
+MAX_BATCH_SIZE = int(os.environ.get("EMBEDDING_MAX_BATCH_SIZE", "250"))
+MAX_BATCH_TOKENS = int(os.environ.get("EMBEDDING_MAX_BATCH_TOKENS", "20000"))
+
+_default_counter = None
+
+
+def token_counter(encoder):
+    """Turn a tiktoken encoder into a text -> token count function."""
+    return lambda text: len(encoder.encode(text, disallowed_special=()))
+
+
+def default_token_counter():
+    """
+    Token counter used when the caller has no encoder of its own.
+
+    Falls back to a characters/4 estimate if tiktoken is unavailable. Either
+    way the count only approximates the provider's tokenizer, which is why
+    the default token budget leaves headroom below the documented limit.
+    """
+    global _default_counter
+    if _default_counter is None:
+        try:
+            import tiktoken
+            _default_counter = token_counter(tiktoken.get_encoding("cl100k_base"))
+        except Exception:
+            _default_counter = lambda text: len(text) // 4 + 1
+    return _default_counter
+
+
+def pack_batches(texts, max_batch_size=MAX_BATCH_SIZE, max_batch_tokens=MAX_BATCH_TOKENS, count_tokens=None):
+    """
+    Group texts into requests that respect the provider's count and token limits.
+
+    Texts are packed greedily in order. A single text over the token budget
+    is sent on its own and left to the provider to truncate.
+
+    Args:
+        texts (list): Texts to embed.
+        max_batch_size (int): Maximum number of texts per request.
+        max_batch_tokens (int): Maximum total tokens per request.
+        count_tokens (callable): Text -> token count; defaults to default_token_counter().
+
+    Yields:
+        list: Indices into texts for each request.
+    """
+    count_tokens = count_tokens or default_token_counter()
+    batch, batch_tokens = [], 0
+    for i, text in enumerate(texts):
+        tokens = count_tokens(text)
+        if batch and (len(batch) >= max_batch_size or batch_tokens + tokens > max_batch_tokens):
+            yield batch
+            batch, batch_tokens = [], 0
+        batch.append(i)
+        batch_tokens += tokens
+    if batch:
+        yield batch
+
@@ -0,0 +1,275 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from array import array
+from collections import OrderedDict
+
+# On-disk location and size bound of the shared embedding cache
+EMBEDDING_CACHE_PATH = os.environ.get("EMBEDDING_CACHE_PATH", "./embedding_cache.sqlite3")
+EMBEDDING_CACHE_MAX_ENTRIES = int(os.environ.get("EMBEDDING_CACHE_MAX_ENTRIES", "1000000"))
+
+# Size bound of the in-process query embedding cache
+QUERY_CACHE_MAX_ENTRIES = int(os.environ.get("QUERY_CACHE_MAX_ENTRIES", "10000"))
+
+_default_cache = None
+_default_query_cache = None
+
+
+def normalize_text(text):
+    """Collapse whitespace so re-extracted text with different spacing hits the same entry."""
+    return " ".join(text.split())
+
+
+class EmbeddingCache:
+    """
+    Persistent embedding cache keyed by (model name, normalized text hash).
+
+    Vectors are stored as float32 blobs in SQLite, which is safe to share
+    between processes. Once the cache holds more than ``max_entries`` rows
+    the least recently used ones are evicted.
+    """
+
+    def __init__(self, path=EMBEDDING_CACHE_PATH, max_entries=EMBEDDING_CACHE_MAX_ENTRIES):
+        self.path = path
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            " key BLOB PRIMARY KEY, vector BLOB NOT NULL, last_used REAL NOT NULL)"
+        )
+        self._connection.execute("CREATE INDEX IF NOT EXISTS embeddings_last_used ON embeddings (last_used)")
+        self._connection.commit()
+        self._entries = self._connection.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+
+    @staticmethod
+    def make_key(model_name, text):
+        return hashlib.sha256(f"{model_name}\0{normalize_text(text)}".encode("utf-8")).digest()
+
+    def get_many(self, model_name, texts):
+        """
+        Look up cached vectors.
+
+        Args:
+            model_name (str): Embedding model the vectors were produced with.
+            texts (list): Texts to look up.
+
+        Returns:
+            list: One vector (list of floats) or None per text, in input order.
+        """
+        keys = [self.make_key(model_name, text) for text in texts]
+        found = {}
+        with self._lock:
+            for start in range(0, len(keys), 500):
+                batch = keys[start:start + 500]
+                placeholders = ",".join("?" * len(batch))
+                rows = self._connection.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})", batch
+                ).fetchall()
+                found.update(rows)
+            if found:
+                now = time.time()
+                self._connection.executemany(
+                    "UPDATE embeddings SET last_used = ? WHERE key = ?", [(now, key) for key in found]
+                )
+                self._connection.commit()
+            results = [_decode(found[key]) if key in found else None for key in keys]
+            hit_count = sum(result is not None for result in results)
+            self.hits += hit_count
+            self.misses += len(results) - hit_count
+        return results
+
+    def put_many(self, model_name, texts, vectors):
+        """Store vectors for texts, skipping any that are None, then evict if over budget."""
+        now = time.time()
+        rows = [
+            (self.make_key(model_name, text), array("f", vector).tobytes(), now)
+            for text, vector in zip(texts, vectors)
+            if vector is not None
+        ]
+        if not rows:
+            return
+        with self._lock:
+            self._connection.executemany(
+                "INSERT OR REPLACE INTO embeddings (key, vector, last_used) VALUES (?, ?, ?)", rows
+            )
+            # Counted rather than derived from total_changes, which also counts
+            # replaced keys and misses rows written by other processes
+            self._entries = self._connection.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+            if self._entries > self.max_entries:
+                self._connection.execute(
+                    "DELETE FROM embeddings WHERE key IN "
+                    "(SELECT key FROM embeddings ORDER BY last_used LIMIT ?)",
+                    (self._entries - self.max_entries,),
+                )
+                self._entries = self._connection.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+            self._connection.commit()
+
+    def embed(self, model_name, texts, embed_fn):
+        """
+        Return embeddings for texts, calling embed_fn only for cache misses.
+
+        Args:
+            model_name (str): Embedding model name, part of the cache key.
+            texts (list): Texts to embed.
+            embed_fn (callable): Takes a list of texts and returns one vector
+                (or None on failure) per text.
+
+        Returns:
+            list: One vector or None per text, in input order.
+        """
+        results = self.get_many(model_name, texts)
+        missing = {}
+        for i, (text, result) in enumerate(zip(texts, results)):
+            if result is None:
+                missing.setdefault(normalize_text(text), []).append(i)
+        if not missing:
+            return results
+
+        missing_texts = [texts[positions[0]] for positions in missing.values()]
+        vectors = embed_fn(missing_texts)
+        for positions, vector in zip(missing.values(), vectors):
+            for i in positions:
+                results[i] = vector
+        self.put_many(model_name, missing_texts, vectors)
+        return results
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "entries": self._entries,
+            "max_entries": self.max_entries,
+        }
+
+
+class QueryEmbeddingCache:
+    """
+    In-process LRU cache of query embeddings keyed by (model name, normalized text).
+
+    Questions are short and often repeated, so unlike EmbeddingCache this
+    keeps vectors in memory and skips SQLite entirely; a hit costs a dict
+    lookup instead of a round trip to the embedding API.
+    """
+
+    def __init__(self, max_entries=QUERY_CACHE_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, model_name, text):
+        key = (model_name, normalize_text(text))
+        with self._lock:
+            vector = self._entries.get(key)
+            if vector is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return vector
+
+    def put(self, model_name, text, vector):
+        if vector is None:
+            return
+        key = (model_name, normalize_text(text))
+        with self._lock:
+            self._entries[key] = vector
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def embed_query(self, model_name, text, embed_fn):
+        """
+        Return the embedding of a query, calling embed_fn only on a cache miss.
+
+        Args:
+            model_name (str): Embedding model name, part of the cache key.
+            text (str): Query text.
+            embed_fn (callable): Takes the text and returns its vector.
+
+        Returns:
+            list: The query vector.
+        """
+        vector = self.get(model_name, text)
+        if vector is None:
+            vector = embed_fn(text)
+            self.put(model_name, text, vector)
+        return vector
+
+    async def aembed_query(self, model_name, text, aembed_fn):
+        """Async variant of embed_query(); aembed_fn is a coroutine function."""
+        vector = self.get(model_name, text)
+        if vector is None:
+            vector = await aembed_fn(text)
+            self.put(model_name, text, vector)
+        return vector
+
+    async def aembed_queries(self, model_name, texts, aembed_many_fn):
+        """
+        Embed several queries, sending all cache misses in one call.
+
+        Args:
+            model_name (str): Embedding model name, part of the cache key.
+            texts (list): Query texts.
+            aembed_many_fn (callable): Coroutine function taking a list of
+                texts and returning one vector per text.
+
+        Returns:
+            list: One vector per text, in input order.
+        """
+        vectors = [self.get(model_name, text) for text in texts]
+        missing = {}
+        for i, (text, vector) in enumerate(zip(texts, vectors)):
+            if vector is None:
+                missing.setdefault(normalize_text(text), []).append(i)
+        if missing:
+            missing_texts = [texts[positions[0]] for positions in missing.values()]
+            for text, positions, vector in zip(missing_texts, missing.values(), await aembed_many_fn(missing_texts)):
+                self.put(model_name, text, vector)
+                for i in positions:
+                    vectors[i] = vector
+        return vectors
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+        }
+
+
+def default_cache():
+    """Return the process-wide cache shared by all embedding call sites."""
+    global _default_cache
+    if _default_cache is None:
+        _default_cache = EmbeddingCache()
+    return _default_cache
+
+
+def default_query_cache():
+    """Return the process-wide query embedding cache."""
+    global _default_query_cache
+    if _default_query_cache is None:
+        _default_query_cache = QueryEmbeddingCache()
+    return _default_query_cache
+
+
+def _decode(blob):
+    vector = array("f")
+    vector.frombytes(blob)
+    return vector.tolist()
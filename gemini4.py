@@ -1,13 +1,20 @@
 import os
 from PyPDF2 import PdfReader
 from langchain.text_splitter import CharacterTextSplitter
+from ingestion import INGESTION_WORKERS, chunk_all_pdfs
+from ingestion_manifest import IngestionManifest
+from alloydb_store import PgVectorPool
+from async_embedding import AsyncEmbeddingClient
+from embedding_cache import default_query_cache
 from google.cloud import alloydb_v1beta
 from vertexai.preview.language_models import GenerativeModel
 
 # Initialize Vertex AI and Gemini Model
 import vertexai
 vertexai.init(project="playpen-33fcd2", location="europe-central12")
-GENAI_MODEL = GenerativeModel("gemini-1.5-fash-002")
+GENAI_MODEL_NAME = "gemini-1.5-fash-002"
+GENAI_MODEL = GenerativeModel(GENAI_MODEL_NAME)
+EMBEDDING_CLIENT = AsyncEmbeddingClient(lambda batch: GENAI_MODEL.get_embeddings(batch).embeddings)
 
 # AlloyDB Credentials
 ALLOYDB_HOST = "your-alloydb-instance-ip"
@@ -15,6 +22,13 @@ ALLOYDB_PORT = "5432"
 ALLOYDB_USER = "your-username"
 ALLOYDB_PASSWORD = "your-password"
 ALLOYDB_DATABASE = "your-database"
+ALLOYDB_POOL = PgVectorPool(
+    host=ALLOYDB_HOST,
+    port=ALLOYDB_PORT,
+    user=ALLOYDB_USER,
+    password=ALLOYDB_PASSWORD,
+    dbname=ALLOYDB_DATABASE,
+)
 
 # Path to PDF folder
 PDF_FOLDER = "./pdfs"
@@ -36,10 +50,7 @@ def read_pdf(pdf_path):
     """Read and extract text from a PDF file."""
     try:
         reader = PdfReader(pdf_path)
-        pdf_text = ""
-        for page in reader.pages:
-            pdf_text += page.extract_text()
-        return pdf_text
+        return "".join(page.extract_text() for page in reader.pages)
     except Exception as e:
         print(f"Error reading PDF file {pdf_path}: {e}")
         return ""
@@ -51,57 +62,41 @@ def split_text_into_chunks(text, chunk_size=300, chunk_overlap=100):
 
 def create_vector_store_in_alloydb(store_name, chunks, embeddings):
     """
-    Store embeddings into AlloyDB.
-   
+    Store embeddings into AlloyDB with batched COPY, resuming an interrupted load of the same chunks.
+
     Args:
         store_name (str): Name of the bucket.
         chunks (list): List of text chunks.
         embeddings (list): Embeddings for the chunks.
 
     Returns:
-        None
+        bool: True if every chunk was stored; chunks without an embedding
+        are skipped and filled in by the next load of the same chunks.
     """
     try:
-        import psycopg2
-        connection = psycopg2.connect(
-            host=ALLOYDB_HOST,
-            port=ALLOYDB_PORT,
-            user=ALLOYDB_USER,
-            password=ALLOYDB_PASSWORD,
-            dbname=ALLOYDB_DATABASE,
-        )
-        cursor = connection.cursor()
-
-        # Create table for the vector store
-        cursor.execute(f"""
-        CREATE TABLE IF NOT EXISTS {store_name} (
-            id SERIAL PRIMARY KEY,
-            text_chunk TEXT,
-            embedding VECTOR(768)  -- Assuming 768 dimensions for embeddings
-        );
-        """)
-        connection.commit()
-
-        # Insert chunks and embeddings into the table
-        for chunk, embedding in zip(chunks, embeddings):
-            cursor.execute(
-                f"INSERT INTO {store_name} (text_chunk, embedding) VALUES (%s, %s)",
-                (chunk, embedding.tolist()),
-            )
-        connection.commit()
-
+        # Assuming 768 dimensions for embeddings
+        ALLOYDB_POOL.bulk_load(store_name, chunks, embeddings, dimension=768, source_id=GENAI_MODEL_NAME)
+        missing = sum(embedding is None for embedding in embeddings)
+        if missing:
+            print(f"{missing} chunks of {store_name} have no embedding; they will be retried on the next run.")
+            return False
         print(f"Data stored successfully in AlloyDB for {store_name}.")
+        return True
     except Exception as e:
         print(f"Error storing data in AlloyDB: {e}")
-    finally:
-        if connection:
-            cursor.close()
-            connection.close()
+        return False
+
+def delete_vectors_from_alloydb(store_name):
+    """Drop a bucket's table, if it exists, before re-ingesting or after its file was deleted."""
+    try:
+        ALLOYDB_POOL.drop_table(store_name)
+    except Exception as e:
+        print(f"Error deleting data from AlloyDB: {e}")
 
 def retrieve_from_alloydb(store_name, query_embedding, top_k=5):
     """
     Retrieve relevant documents from AlloyDB using embeddings.
-   
+
     Args:
         store_name (str): Name of the bucket.
         query_embedding (list): Query embedding.
@@ -111,71 +106,39 @@ def retrieve_from_alloydb(store_name, query_embedding, top_k=5):
         list: Relevant text chunks.
     """
     try:
-        import psycopg2
-        connection = psycopg2.connect(
-            host=ALLOYDB_HOST,
-            port=ALLOYDB_PORT,
-            user=ALLOYDB_USER,
-            password=ALLOYDB_PASSWORD,
-            dbname=ALLOYDB_DATABASE,
-        )
-        cursor = connection.cursor()
-
-        # Use a similarity function (cosine similarity) for retrieval
-        cursor.execute(f"""
-        SELECT text_chunk
-        FROM {store_name}
-        ORDER BY embedding <-> %s
-        LIMIT {top_k};
-        """, (query_embedding,))
-        results = cursor.fetchall()
-        return [row[0] for row in results]
+        return ALLOYDB_POOL.top_k(store_name, query_embedding, top_k)
     except Exception as e:
         print(f"Error retrieving data from AlloyDB: {e}")
         return []
-    finally:
-        if connection:
-            cursor.close()
-            connection.close()
 
 def generate_embeddings(chunks):
-    """Generate embeddings using Vertex AI."""
-    embeddings = []
-    for chunk in chunks:
-        response = GENAI_MODEL.get_embeddings([chunk])
-        embeddings.append(response.embeddings[0])
-    return embeddings
+    """Generate embeddings using Vertex AI, with batched requests sent concurrently (None where embedding failed)."""
+    return EMBEDDING_CLIENT.embed(chunks)
 
 ### Main Functions ###
-def process_all_pdfs():
+def process_all_pdfs(max_workers=INGESTION_WORKERS):
     """
     Process all PDFs and store them in AlloyDB.
+
+    PDF extraction and chunking run in a process pool, one task per bucket;
+    embedding and storage happen here as each bucket finishes. Buckets whose
+    file is unchanged since the last run are skipped, and the tables of
+    deleted files are dropped.
     """
     print("\nProcessing all PDFs and storing data in AlloyDB...")
 
-    for store_name, pdf_path in PDF_FILES.items():
-        print(f"\nProcessing '{store_name}' bucket...")
-
-        # Validate the file path
-        if not validate_file_path(pdf_path):
-            print(f"Skipping '{store_name}' bucket due to missing file.")
-            continue
-
-        # Read the PDF content
-        pdf_text = read_pdf(pdf_path)
-
-        if not pdf_text:
-            print(f"Skipping '{store_name}' bucket due to empty content in {pdf_path}.")
-            continue
-
-        # Split the PDF text into chunks
-        text_chunks = split_text_into_chunks(pdf_text)
+    manifest = IngestionManifest("alloydb", params={"embedding_model": GENAI_MODEL_NAME})
+    for store_name in manifest.removed_buckets(PDF_FILES):
+        delete_vectors_from_alloydb(store_name)
+        manifest.forget(store_name)
 
+    for store_name, text_chunks in chunk_all_pdfs(PDF_FILES, max_workers, manifest=manifest):
         # Generate embeddings for the chunks
         embeddings = generate_embeddings(text_chunks)
 
-        # Store the data in AlloyDB
-        create_vector_store_in_alloydb(store_name, text_chunks, embeddings)
+        # The loader replaces the bucket's previous rows, or resumes an interrupted load
+        if create_vector_store_in_alloydb(store_name, text_chunks, embeddings):
+            manifest.record(store_name)
 
     print("\nAll PDFs have been processed and stored successfully.")
 
@@ -192,7 +155,9 @@ def interactive_chat(store_name):
             break
 
         # Generate query embedding
-        query_embedding = GENAI_MODEL.get_embeddings([query]).embeddings[0]
+        query_embedding = default_query_cache().embed_query(
+            GENAI_MODEL_NAME, query, lambda text: GENAI_MODEL.get_embeddings([text]).embeddings[0]
+        )
 
         # Retrieve relevant text chunks from AlloyDB
         results = retrieve_from_alloydb(store_name, query_embedding)
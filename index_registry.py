@@ -0,0 +1,125 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+
+# Memory the loaded indexes may use together before cold ones are evicted (0 = no limit)
+INDEX_MEMORY_BUDGET_MB = int(os.environ.get("INDEX_MEMORY_BUDGET_MB", "2048"))
+
+# Seconds between checks of whether a loaded index was superseded on disk
+INDEX_VERSION_CHECK_SECONDS = float(os.environ.get("INDEX_VERSION_CHECK_SECONDS", "10"))
+
+
+class IndexRegistry:
+    """
+    Lazily loaded, LRU-evicted set of named indexes.
+
+    ``load_fn(name)`` is called the first time a name is requested and
+    ``size_fn(value)`` gives the bytes it occupies. Once the loaded values
+    exceed ``memory_budget`` bytes the least recently used ones are dropped;
+    requests still holding a reference keep working, and the next request
+    for an evicted name loads it again. The most recently loaded value is
+    never evicted, even if it alone exceeds the budget.
+
+    With ``stale_fn(name, value)``, a loaded value is checked at most every
+    ``check_seconds`` when it is requested; if the check returns True the
+    name is loaded again and replaces it. The old value keeps serving until
+    the new one is loaded.
+    """
+
+    def __init__(self, load_fn, size_fn, memory_budget=INDEX_MEMORY_BUDGET_MB * 1024 * 1024, stale_fn=None,
+                 check_seconds=INDEX_VERSION_CHECK_SECONDS):
+        self.load_fn = load_fn
+        self.size_fn = size_fn
+        self.memory_budget = memory_budget
+        self.stale_fn = stale_fn
+        self.check_seconds = check_seconds
+        self.memory_used = 0
+        self.stats = {"hits": 0, "loads": 0, "reloads": 0, "evictions": 0}
+        self._entries = OrderedDict()  # name -> (value, size)
+        self._checked = {}  # name -> time.monotonic() of the last stale_fn check
+        self._lock = threading.Lock()
+        self._loading = {}
+
+    def __contains__(self, name):
+        return name in self._entries
+
+    def loaded(self):
+        """Names currently loaded, least recently used first, with their sizes in bytes."""
+        with self._lock:
+            return {name: size for name, (_, size) in self._entries.items()}
+
+    def peek(self, name):
+        """Return the value if it is loaded, without loading it or touching the LRU order."""
+        entry = self._entries.get(name)
+        return entry[0] if entry else None
+
+    def get(self, name):
+        """
+        Return the value for a name, loading it (and evicting cold ones) if needed.
+
+        Concurrent requests for the same unloaded or stale name share a single load.
+        """
+        with self._lock:
+            value = self._hit(name)
+        if value is not None and not self._is_stale(name, value):
+            return value
+
+        with self._lock:
+            loading = self._loading.setdefault(name, threading.Lock())
+        with loading:
+            with self._lock:
+                entry = self._entries.get(name)
+                if entry is not None and entry[0] is not value:
+                    # Loaded (or reloaded) by another request meanwhile
+                    return self._hit(name)
+            loaded = self.load_fn(name)
+            size = self.size_fn(loaded)
+            with self._lock:
+                self.stats["reloads" if name in self._entries else "loads"] += 1
+                self._drop(name)
+                self._entries[name] = (loaded, size)
+                self._checked[name] = time.monotonic()
+                self.memory_used += size
+                self._loading.pop(name, None)
+                self._evict()
+            return loaded
+
+    def needs_load(self, name):
+        """True if get(name) may block: the name is not loaded or its stale check is due."""
+        if name not in self._entries:
+            return True
+        return self.stale_fn is not None and time.monotonic() - self._checked.get(name, 0.0) >= self.check_seconds
+
+    def _hit(self, name):
+        entry = self._entries.get(name)
+        if entry is None:
+            return None
+        self._entries.move_to_end(name)
+        self.stats["hits"] += 1
+        return entry[0]
+
+    def _is_stale(self, name, value):
+        if self.stale_fn is None:
+            return False
+        now = time.monotonic()
+        with self._lock:
+            if now - self._checked.get(name, 0.0) < self.check_seconds:
+                return False
+            self._checked[name] = now
+        return self.stale_fn(name, value)
+
+    def evict(self, name):
+        with self._lock:
+            self._drop(name)
+
+    def _evict(self):
+        while self.memory_budget and self.memory_used > self.memory_budget and len(self._entries) > 1:
+            self._drop(next(iter(self._entries)))
+            self.stats["evictions"] += 1
+
+    def _drop(self, name):
+        entry = self._entries.pop(name, None)
+        self._checked.pop(name, None)
+        if entry is not None:
+            self.memory_used -= entry[1]
@@ -0,0 +1,219 @@
+import argparse
+import hashlib
+import json
+import os
+import time
+from data_reader import TOKEN_CHUNK_OVERLAP, TOKEN_CHUNK_SIZE, DataReader, default_encoder
+from dedup import CHUNK_DEDUP_DISTANCE, DuplicateFilter
+from ingestion import INGESTION_BATCH_CHUNKS
+from ingestion_manifest import file_sha256
+from mmap_store import load_index, save_index
+from vector_index import VectorIndex
+
+# Root folder holding one sub-folder per bucket, each with one sub-folder
+# per snapshot version plus a CURRENT pointer
+SNAPSHOT_DIR = os.environ.get("INDEX_SNAPSHOT_DIR", "./index_snapshots")
+CURRENT_FILE = "CURRENT"
+
+# Bucket used for requests that name none
+DEFAULT_BUCKET = os.environ.get("DEFAULT_BUCKET", "default")
+
+
+def snapshot_version(pdf_digest, params):
+    """Version id derived from the source content and build parameters, so identical builds share it."""
+    payload = json.dumps({"pdf_sha256": pdf_digest, "params": params}, sort_keys=True)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()[:16]
+
+
+def bucket_dir(bucket, snapshot_dir=SNAPSHOT_DIR):
+    """Snapshot folder of one bucket (knowledge base)."""
+    if not bucket or os.sep in bucket or bucket.startswith("."):
+        raise ValueError(f"Invalid bucket name: {bucket!r}")
+    return os.path.join(snapshot_dir, bucket)
+
+
+def has_snapshot(bucket, snapshot_dir=SNAPSHOT_DIR):
+    """True if the bucket name is valid and has a current snapshot."""
+    try:
+        return os.path.exists(os.path.join(bucket_dir(bucket, snapshot_dir), CURRENT_FILE))
+    except ValueError:
+        return False
+
+
+def list_buckets(snapshot_dir=SNAPSHOT_DIR):
+    """Names of the buckets that have a current snapshot."""
+    if not os.path.isdir(snapshot_dir):
+        return []
+    return sorted(name for name in os.listdir(snapshot_dir) if has_snapshot(name, snapshot_dir))
+
+
+def snapshot_nbytes(snapshot_dir, version):
+    """Bytes a loaded snapshot maps into memory: the size of its files."""
+    directory = os.path.join(snapshot_dir, version)
+    return sum(entry.stat().st_size for entry in os.scandir(directory) if entry.is_file())
+
+
+def current_version(snapshot_dir=SNAPSHOT_DIR):
+    path = os.path.join(snapshot_dir, CURRENT_FILE)
+    if not os.path.exists(path):
+        return None
+    with open(path, "r", encoding="utf-8") as f:
+        return f.read().strip() or None
+
+
+def set_current_version(version, snapshot_dir=SNAPSHOT_DIR):
+    tmp_path = os.path.join(snapshot_dir, f"{CURRENT_FILE}.tmp")
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(version)
+    os.replace(tmp_path, os.path.join(snapshot_dir, CURRENT_FILE))
+
+
+def build_snapshot(pdf_path, embeddings, snapshot_dir=SNAPSHOT_DIR, chunk_size=300, chunk_overlap=100,
+                   encoder=None, chunk_tokens=TOKEN_CHUNK_SIZE, chunk_overlap_tokens=TOKEN_CHUNK_OVERLAP,
+                   dedup_distance=CHUNK_DEDUP_DISTANCE, batch_size=INGESTION_BATCH_CHUNKS):
+    """
+    Chunk and embed a PDF into a new snapshot and make it the current one.
+
+    With an encoder the PDF is split by tokens and each chunk's token count
+    is stored with the snapshot; otherwise it is split by characters.
+    Chunks repeating an earlier one are dropped before embedding. Chunks are
+    embedded and added to the index ``batch_size`` at a time as the PDF is
+    read, so the full chunk list and its embeddings are never held. If any
+    chunk fails to embed, or the PDF yields no chunks, nothing is written and
+    CURRENT is left as it was; save_index() writes the version directory
+    under a temporary name and renames it into place, so an existing version
+    directory is always complete.
+
+    Args:
+        pdf_path (str): Source PDF.
+        embeddings: LangChain embeddings object with ``embed_documents`` and a ``model`` name.
+        snapshot_dir (str): Folder for the bucket's snapshots (see bucket_dir()).
+        chunk_size (int): Size of each character chunk.
+        chunk_overlap (int): Overlap between consecutive character chunks.
+        encoder: tiktoken Encoding for token-based chunking.
+        chunk_tokens (int): Maximum tokens per chunk when splitting by tokens.
+        chunk_overlap_tokens (int): Token overlap between consecutive chunks.
+        dedup_distance (int): SimHash bit distance under which a chunk counts
+            as a duplicate (see dedup.dedupe_chunks); -1 keeps every chunk.
+        batch_size (int): Chunks per embedding request.
+
+    Returns:
+        str: The snapshot version.
+
+    Raises:
+        RuntimeError: If the snapshot would be empty or incomplete.
+    """
+    if encoder is not None:
+        # "sources": snapshots from before page/offset metadata was stored get rebuilt
+        params = {"chunker": encoder.name, "chunk_tokens": chunk_tokens, "chunk_overlap_tokens": chunk_overlap_tokens,
+                  "sources": True}
+    else:
+        params = {"chunk_size": chunk_size, "chunk_overlap": chunk_overlap}
+    params["embedding_model"] = embeddings.model
+    params["dedup_distance"] = dedup_distance
+    pdf_digest = file_sha256(pdf_path)
+    version = snapshot_version(pdf_digest, params)
+    target = os.path.join(snapshot_dir, version)
+
+    if os.path.exists(target):
+        print(f"Snapshot {version} already exists for {pdf_path}, skipping embedding.")
+    else:
+        print(f"Building snapshot {version} from {pdf_path}...")
+        reader = DataReader(pdf_path)
+        if encoder is not None:
+            document = os.path.basename(pdf_path)
+            # location is (page, char_start, char_end, token_start, token_end)
+            spans = (
+                (chunk, location[-1] - location[-2], (document, *location))
+                for chunk, *location in reader.iter_page_chunks(encoder, chunk_tokens, chunk_overlap_tokens)
+            )
+        else:
+            spans = ((chunk, None, None) for chunk in reader.iter_chunks(chunk_size, chunk_overlap))
+        duplicates = DuplicateFilter(dedup_distance)
+        index = VectorIndex()
+        batch = []
+        for span in spans:
+            if duplicates.keep(span[0]):
+                batch.append(span)
+            if len(batch) >= batch_size:
+                _embed_batch(index, embeddings, batch, version)
+                batch = []
+        if batch:
+            _embed_batch(index, embeddings, batch, version)
+        if duplicates.dropped:
+            print(f"Dropped {duplicates.dropped} duplicate chunks.")
+        if not len(index):
+            raise RuntimeError(f"No text chunks extracted from {pdf_path}; snapshot not built.")
+        index.build_lexical()
+        os.makedirs(snapshot_dir, exist_ok=True)
+        save_index(target, index, {
+            "version": version,
+            "source": os.path.basename(pdf_path),
+            "source_sha256": pdf_digest,
+            "params": params,
+            "built_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        })
+        print(f"Stored {len(index)} chunks in {target}.")
+
+    set_current_version(version, snapshot_dir)
+    return version
+
+
+def _embed_batch(index, embeddings, batch, version):
+    chunks = [chunk for chunk, _, _ in batch]
+    vectors = embeddings.embed_documents(chunks)
+    missing = sum(vector is None for vector in vectors)
+    if missing:
+        raise RuntimeError(f"{missing} of {len(chunks)} chunks in a batch failed to embed; snapshot {version} not built.")
+    if batch[0][1] is None:
+        index.add(chunks, vectors)
+    else:
+        index.add(chunks, vectors, [count for _, count, _ in batch], [source for _, _, source in batch])
+
+
+def load_snapshot(snapshot_dir=SNAPSHOT_DIR, version=None):
+    """
+    Memory-map a snapshot, by default the one CURRENT points to.
+
+    Returns:
+        VectorIndex: The index; ``index.metadata["version"]`` identifies it.
+    """
+    version = version or current_version(snapshot_dir)
+    if not version:
+        raise FileNotFoundError(
+            f"No index snapshot found in {snapshot_dir}. Build one with: python index_snapshot.py <pdf_path>"
+        )
+    return load_index(os.path.join(snapshot_dir, version))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build the prebuilt index snapshot served by the Assist Genie API.")
+    parser.add_argument("pdf_path", nargs="?", default="Data_LLM.pdf")
+    parser.add_argument("--bucket", default=DEFAULT_BUCKET, help="Knowledge base the PDF is served as (usecase.name)")
+    parser.add_argument("--snapshot-dir", default=SNAPSHOT_DIR)
+    parser.add_argument("--chunker", choices=("tokens", "characters"), default="tokens")
+    parser.add_argument("--chunk-tokens", type=int, default=TOKEN_CHUNK_SIZE)
+    parser.add_argument("--chunk-overlap-tokens", type=int, default=TOKEN_CHUNK_OVERLAP)
+    parser.add_argument("--chunk-size", type=int, default=300, help="Characters, with --chunker characters")
+    parser.add_argument("--chunk-overlap", type=int, default=100, help="Characters, with --chunker characters")
+    parser.add_argument("--dedup-distance", type=int, default=CHUNK_DEDUP_DISTANCE,
+                        help="SimHash bits under which chunks count as duplicates (-1 keeps all)")
+    args = parser.parse_args()
+
+    from embedding import EmbeddingsGenerator
+    embeddings = EmbeddingsGenerator().embeddings
+    target_dir = bucket_dir(args.bucket, args.snapshot_dir)
+    encoder = default_encoder() if args.chunker == "tokens" else None
+    try:
+        version = build_snapshot(
+            args.pdf_path, embeddings, target_dir, args.chunk_size, args.chunk_overlap,
+            encoder, args.chunk_tokens, args.chunk_overlap_tokens, args.dedup_distance,
+        )
+    except RuntimeError as e:
+        print(f"Error: {e}")
+        raise SystemExit(1)
+    print(f"Current snapshot for bucket '{args.bucket}': {version}")
+
+
+if __name__ == "__main__":
+    main()
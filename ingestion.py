@@ -0,0 +1,268 @@
+import os
+import pickle
+import tempfile
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from data_reader import TOKEN_CHUNK_OVERLAP, default_encoder, iter_page_chunks, iter_pdf_pages, iter_text_chunks
+from dedup import CHUNK_DEDUP_DISTANCE, DuplicateFilter
+from ingestion_manifest import file_sha256
+
+# Number of worker processes used for PDF extraction and chunking.
+# 1 keeps the old sequential behaviour.
+INGESTION_WORKERS = int(os.environ.get("INGESTION_WORKERS", os.cpu_count() or 1))
+
+# Chunk length in tokens; 0 splits by characters (chunk_size/chunk_overlap) instead
+INGESTION_CHUNK_TOKENS = int(os.environ.get("INGESTION_CHUNK_TOKENS", "256"))
+
+# Chunks handed to the embedder at a time by stream_all_pdfs()
+INGESTION_BATCH_CHUNKS = int(os.environ.get("INGESTION_BATCH_CHUNKS", "512"))
+
+
+def iter_chunk_batches(pdf_path, chunk_size=300, chunk_overlap=100, chunk_tokens=0,
+                       chunk_overlap_tokens=TOKEN_CHUNK_OVERLAP, with_sources=False,
+                       dedup_distance=CHUNK_DEDUP_DISTANCE, batch_size=INGESTION_BATCH_CHUNKS):
+    """
+    Read a PDF and yield its text chunks in batches of at most ``batch_size``.
+
+    Pages are streamed into the splitter and chunks are deduplicated as they
+    come, so only one batch of chunks is held at a time.
+
+    Args:
+        pdf_path (str): Path to the PDF file.
+        chunk_size (int): Size of each character chunk.
+        chunk_overlap (int): Overlap between consecutive character chunks.
+        chunk_tokens (int): Split by tokens into chunks of at most this many; 0 splits by characters.
+        chunk_overlap_tokens (int): Token overlap between consecutive chunks.
+        with_sources (bool): Also yield each token chunk's location, see VectorIndex.add().
+        dedup_distance (int): Drop chunks within this SimHash distance of an
+            earlier chunk (see dedup.dedupe_chunks); -1 keeps every chunk.
+        batch_size (int): Maximum chunks per batch.
+
+    Yields:
+        tuple: (chunks, sources) where sources is None unless requested and chunking by tokens.
+    """
+    if chunk_tokens:
+        document = os.path.basename(pdf_path)
+        spans = (
+            (chunk, (document, *location))
+            for chunk, *location in iter_page_chunks(
+                iter_pdf_pages(pdf_path), default_encoder(), chunk_tokens, chunk_overlap_tokens
+            )
+        )
+    else:
+        spans = ((chunk, None) for chunk in iter_text_chunks(iter_pdf_pages(pdf_path), chunk_size, chunk_overlap))
+    with_sources = with_sources and bool(chunk_tokens)
+
+    duplicates = DuplicateFilter(dedup_distance)
+    chunks, sources = [], []
+    for chunk, source in spans:
+        if not duplicates.keep(chunk):
+            continue
+        chunks.append(chunk)
+        sources.append(source)
+        if len(chunks) >= batch_size:
+            yield chunks, sources if with_sources else None
+            chunks, sources = [], []
+    if chunks:
+        yield chunks, sources if with_sources else None
+    if duplicates.dropped:
+        print(f"Dropped {duplicates.dropped} duplicate chunks from {pdf_path}.")
+
+
+def extract_and_chunk(store_name, pdf_path, spool_dir, chunk_size=300, chunk_overlap=100, chunk_tokens=0,
+                      chunk_overlap_tokens=TOKEN_CHUNK_OVERLAP, with_sources=False, dedup_distance=CHUNK_DEDUP_DISTANCE,
+                      batch_size=INGESTION_BATCH_CHUNKS):
+    """
+    Read a PDF and spool its chunk batches to a file.
+
+    Runs inside a worker process. Batches from iter_chunk_batches() are
+    pickled to a file in ``spool_dir`` one at a time, so neither the worker
+    nor the parent holds the bucket's full chunk list; only the file path
+    crosses the process boundary.
+
+    Args:
+        store_name (str): Name of the bucket.
+        pdf_path (str): Path to the PDF file.
+        spool_dir (str): Folder for the spool file.
+        Remaining arguments as for iter_chunk_batches().
+
+    Returns:
+        tuple: (store_name, spool_path, chunk count, error) where error is
+        None on success; spool_path is None when there is nothing to read.
+    """
+    if not os.path.exists(pdf_path):
+        return store_name, None, 0, f"File not found at {pdf_path}"
+
+    fd, spool_path = tempfile.mkstemp(prefix=f"{store_name}-", suffix=".chunks", dir=spool_dir)
+    count = 0
+    try:
+        with os.fdopen(fd, "wb") as f:
+            for batch in iter_chunk_batches(pdf_path, chunk_size, chunk_overlap, chunk_tokens, chunk_overlap_tokens,
+                                            with_sources, dedup_distance, batch_size):
+                pickle.dump(batch, f, protocol=pickle.HIGHEST_PROTOCOL)
+                count += len(batch[0])
+    except Exception as e:
+        os.remove(spool_path)
+        return store_name, None, 0, f"Error reading PDF file {pdf_path}: {e}"
+
+    if not count:
+        os.remove(spool_path)
+        return store_name, None, 0, f"Empty content in {pdf_path}"
+
+    return store_name, spool_path, count, None
+
+
+def _read_spool(spool_path):
+    with open(spool_path, "rb") as f:
+        while True:
+            try:
+                yield pickle.load(f)
+            except EOFError:
+                return
+
+
+def stream_all_pdfs(pdf_files, max_workers=INGESTION_WORKERS, chunk_size=300, chunk_overlap=100, manifest=None,
+                    chunk_tokens=INGESTION_CHUNK_TOKENS, chunk_overlap_tokens=TOKEN_CHUNK_OVERLAP,
+                    dedup_distance=CHUNK_DEDUP_DISTANCE, batch_size=INGESTION_BATCH_CHUNKS):
+    """
+    Extract and chunk every bucket, in parallel when more than one worker is allowed.
+
+    Each bucket is handled by its own task, so a slow or broken PDF in one
+    bucket never mixes its chunks with another bucket's. Workers spool their
+    chunks to temporary files, and each bucket is yielded as an iterator
+    over batches of at most ``batch_size`` chunks, so a bucket can be
+    embedded and stored batch by batch without its full chunk list ever
+    being in memory. Consume a bucket's batches before asking for the next
+    bucket; the spool files are removed when the generator finishes.
+
+    Buckets whose files have identical content are extracted once and
+    yielded the same chunks, whose embeddings the content-keyed embedding
+    cache then serves from one computation. Near-duplicate chunks are
+    dropped within each file only: buckets are searched independently, so a
+    chunk is kept in every bucket it occurs in, and chunks repeated across
+    buckets share one embedding computation through the cache rather than
+    one stored vector. With a manifest, buckets whose file and chunking
+    parameters are unchanged since the last run are skipped; call
+    manifest.record(store_name) once a yielded bucket has been stored.
+
+    Args:
+        pdf_files (dict): Mapping of bucket name to PDF path.
+        max_workers (int): Worker process count; 1 or less runs sequentially.
+        chunk_size (int): Size of each character chunk.
+        chunk_overlap (int): Overlap between consecutive character chunks.
+        manifest (IngestionManifest): Optional record of previous ingestions.
+        chunk_tokens (int): Split by tokens into chunks of at most this many;
+            0, or no tokenizer available, splits by characters.
+        chunk_overlap_tokens (int): Token overlap between consecutive chunks.
+        dedup_distance (int): SimHash bit distance under which a chunk counts
+            as a duplicate of an earlier one in the same file; -1 disables.
+        batch_size (int): Maximum chunks per batch.
+
+    Yields:
+        tuple: (store_name, batches) for every bucket that produced text, in
+        completion order. ``batches`` yields (chunks, sources) pairs, where
+        sources gives each chunk's document, page and offsets, or is None
+        when splitting by characters.
+    """
+    if chunk_tokens and default_encoder() is None:
+        chunk_tokens = 0
+    chunk_args = (chunk_size, chunk_overlap, chunk_tokens, chunk_overlap_tokens, True, dedup_distance, batch_size)
+    if manifest is not None:
+        if chunk_tokens:
+            params = {"chunk_tokens": chunk_tokens, "chunk_overlap_tokens": chunk_overlap_tokens}
+        else:
+            params = {"chunk_size": chunk_size, "chunk_overlap": chunk_overlap}
+        params["dedup_distance"] = dedup_distance
+        pdf_files = _changed_pdfs(pdf_files, manifest, params)
+    copies = _identical_files(pdf_files, manifest)
+
+    def batches(name, spool_path):
+        # Cite the bucket's own file name when it reuses another bucket's chunks
+        document = os.path.basename(pdf_files[name])
+        for chunks, sources in _read_spool(spool_path):
+            if sources is not None:
+                sources = [(document, *location) for _, *location in sources]
+            yield chunks, sources
+
+    def results(store_name, spool_path, count, error):
+        for name in copies[store_name]:
+            if error:
+                print(f"Error: {error}")
+                print(f"Skipping '{name}' bucket.")
+                continue
+            if name != store_name:
+                print(f"'{name}' bucket has the same content as '{store_name}', reusing its chunks.")
+            print(f"Extracted {count} chunks for '{name}' bucket.")
+            yield name, batches(name, spool_path)
+        if spool_path:
+            os.remove(spool_path)
+
+    with tempfile.TemporaryDirectory(prefix="ingestion-") as spool_dir:
+        if max_workers <= 1:
+            for store_name in copies:
+                print(f"\nProcessing '{store_name}' bucket...")
+                yield from results(*extract_and_chunk(store_name, pdf_files[store_name], spool_dir, *chunk_args))
+            return
+
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            futures = [
+                executor.submit(extract_and_chunk, store_name, pdf_files[store_name], spool_dir, *chunk_args)
+                for store_name in copies
+            ]
+            for future in as_completed(futures):
+                yield from results(*future.result())
+
+
+def chunk_all_pdfs(pdf_files, max_workers=INGESTION_WORKERS, chunk_size=300, chunk_overlap=100, manifest=None,
+                   chunk_tokens=INGESTION_CHUNK_TOKENS, chunk_overlap_tokens=TOKEN_CHUNK_OVERLAP, with_sources=False,
+                   dedup_distance=CHUNK_DEDUP_DISTANCE):
+    """
+    Like stream_all_pdfs(), but yield each bucket's chunks as one list.
+
+    For stores that need the whole bucket at once, e.g. to fingerprint it or
+    to prune rows that are no longer in it.
+
+    Args:
+        with_sources (bool): Yield each chunk's document, page and offsets as
+            well (None when splitting by characters).
+        Remaining arguments as for stream_all_pdfs().
+
+    Yields:
+        tuple: (store_name, chunks), or (store_name, chunks, sources) with
+        ``with_sources``, for every bucket that produced text, in completion order.
+    """
+    for store_name, batches in stream_all_pdfs(pdf_files, max_workers, chunk_size, chunk_overlap, manifest,
+                                               chunk_tokens, chunk_overlap_tokens, dedup_distance):
+        chunks, sources = [], []
+        for batch_chunks, batch_sources in batches:
+            chunks.extend(batch_chunks)
+            if batch_sources is None:
+                sources = None
+            elif sources is not None:
+                sources.extend(batch_sources)
+        yield (store_name, chunks, sources) if with_sources else (store_name, chunks)
+
+
+def _identical_files(pdf_files, manifest=None):
+    """
+    Map the first bucket of each distinct file content to every bucket with that content.
+
+    Digests already computed by the manifest's is_current() are reused, so
+    each bucket's file is hashed once per run.
+    """
+    by_digest = {}
+    for store_name, pdf_path in pdf_files.items():
+        key = manifest.digest(store_name) if manifest is not None else None
+        if key is None:
+            key = file_sha256(pdf_path) if os.path.exists(pdf_path) else pdf_path
+        by_digest.setdefault(key, []).append(store_name)
+    return {names[0]: names for names in by_digest.values()}
+
+
+def _changed_pdfs(pdf_files, manifest, params):
+    changed = {}
+    for store_name, pdf_path in pdf_files.items():
+        if os.path.exists(pdf_path) and manifest.is_current(store_name, pdf_path, params):
+            print(f"'{store_name}' bucket is unchanged since the last run, skipping.")
+            continue
+        changed[store_name] = pdf_path
+    return changed
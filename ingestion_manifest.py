@@ -0,0 +1,101 @@
+import hashlib
+import json
+import os
+
+# Where the records of already-ingested files are kept between runs
+MANIFEST_DIR = os.environ.get("INGESTION_MANIFEST_DIR", "./ingestion_manifests")
+
+
+def file_sha256(file_path, block_size=1 << 20):
+    """Hash a file's content without loading it into memory at once."""
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class IngestionManifest:
+    """
+    Persistent record of which file content was ingested into which bucket,
+    and with which chunking parameters.
+
+    A bucket is up to date when its file hashes to the recorded digest and
+    the parameters match; anything else has to be re-ingested. Entries are
+    only written by record(), which callers invoke after the bucket's
+    vectors have been stored, so an interrupted run is retried next time.
+
+    Each vector backend keeps its own manifest (``name``), and ``params``
+    holds settings that apply to every bucket, such as the embedding model.
+    """
+
+    def __init__(self, name, params=None, manifest_dir=MANIFEST_DIR):
+        self.path = os.path.join(manifest_dir, f"{name}.json")
+        self.params = params or {}
+        self.entries = {}
+        self._pending = {}
+        if os.path.exists(self.path):
+            try:
+                with open(self.path, "r", encoding="utf-8") as f:
+                    self.entries = json.load(f)
+            except (OSError, ValueError) as e:
+                print(f"Ignoring unreadable ingestion manifest {self.path}: {e}")
+
+    def is_current(self, store_name, file_path, params):
+        """
+        Check whether a bucket's file and parameters match the last ingestion.
+
+        Args:
+            store_name (str): Name of the bucket.
+            file_path (str): Path to the bucket's source file.
+            params (dict): Chunking (and embedding) parameters in effect.
+
+        Returns:
+            bool: True when the bucket can be skipped.
+        """
+        params = {**self.params, **params}
+        digest = file_sha256(file_path)
+        self._pending[store_name] = {"path": file_path, "sha256": digest, "params": params}
+        entry = self.entries.get(store_name)
+        return bool(entry) and entry["sha256"] == digest and entry["params"] == params
+
+    def digest(self, store_name):
+        """SHA-256 of the bucket's file as hashed by is_current(), or None if it was not checked."""
+        entry = self._pending.get(store_name)
+        return entry["sha256"] if entry else None
+
+    def record(self, store_name):
+        """Mark the bucket checked by is_current() as ingested and save the manifest."""
+        entry = self._pending.pop(store_name, None)
+        if entry is None:
+            return
+        self.entries[store_name] = entry
+        self.save()
+
+    def forget(self, store_name):
+        """Drop a bucket from the manifest, e.g. after its vectors were deleted."""
+        if self.entries.pop(store_name, None) is not None:
+            self.save()
+
+    def removed_buckets(self, pdf_files):
+        """
+        List buckets that were ingested before but whose file is gone.
+
+        Args:
+            pdf_files (dict): Current mapping of bucket name to PDF path.
+
+        Returns:
+            list: Bucket names whose vectors should be deleted.
+        """
+        return [
+            store_name
+            for store_name in self.entries
+            if store_name not in pdf_files or not os.path.exists(pdf_files[store_name])
+        ]
+
+    def save(self):
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self.entries, f, indent=2, sort_keys=True)
+        os.replace(tmp_path, self.path)
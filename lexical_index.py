@@ -0,0 +1,163 @@
+import json
+import math
+import os
+import re
+from collections import Counter
+import numpy as np
+from vector_index import top_k_rows
+
+# BM25 term-frequency saturation and length normalization
+BM25_K1 = float(os.environ.get("BM25_K1", "1.2"))
+BM25_B = float(os.environ.get("BM25_B", "0.75"))
+
+# Rank offset in reciprocal rank fusion; larger values flatten the head of each ranking
+RRF_K = int(os.environ.get("RRF_K", "60"))
+
+# On-disk layout, next to the other files of a saved VectorIndex
+LEXICAL_FILE = "bm25.json"
+LEXICAL_OFFSETS_FILE = "bm25_offsets.u64"
+LEXICAL_DOCS_FILE = "bm25_docs.u32"
+LEXICAL_FREQS_FILE = "bm25_freqs.u16"
+LEXICAL_LENGTHS_FILE = "bm25_lengths.u32"
+
+_TOKEN = re.compile(r"\w+")
+
+
+def tokenize(text):
+    return _TOKEN.findall(text.lower())
+
+
+class BM25Index:
+    """
+    Okapi BM25 inverted index over the chunks of a VectorIndex.
+
+    Terms map to integer ids, and the postings are stored CSR-style: for
+    term ``t`` the rows containing it are ``docs[offsets[t]:offsets[t + 1]]``
+    with matching term frequencies in ``freqs``. A query only touches the
+    postings of its own terms, so it costs microseconds however many chunks
+    the index holds, and needs no embedding.
+    """
+
+    def __init__(self, terms, offsets, docs, freqs, lengths, k1=BM25_K1, b=BM25_B):
+        self.terms = terms
+        self.vocabulary = {term: i for i, term in enumerate(terms)}
+        self.offsets = offsets
+        self.docs = docs
+        self.freqs = freqs
+        self.lengths = lengths
+        self.k1 = k1
+        self.b = b
+        self.avg_length = float(np.mean(lengths)) if len(lengths) else 0.0
+
+    @classmethod
+    def build(cls, chunks, k1=BM25_K1, b=BM25_B):
+        """Index a sequence of chunk texts; row ``i`` is ``chunks[i]``."""
+        vocabulary = {}
+        term_ids, docs, freqs, lengths = [], [], [], []
+        for row, chunk in enumerate(chunks):
+            tokens = tokenize(chunk)
+            lengths.append(len(tokens))
+            counts = Counter(vocabulary.setdefault(token, len(vocabulary)) for token in tokens)
+            term_ids.extend(counts)
+            freqs.extend(counts.values())
+            docs.extend([row] * len(counts))
+
+        term_ids = np.asarray(term_ids, dtype=np.int64)
+        # Stable sort keeps each term's postings in row order
+        order = np.argsort(term_ids, kind="stable")
+        offsets = np.zeros(len(vocabulary) + 1, dtype="<u8")
+        np.cumsum(np.bincount(term_ids, minlength=len(vocabulary)), out=offsets[1:])
+        return cls(
+            list(vocabulary),
+            offsets,
+            np.asarray(docs, dtype="<u4")[order],
+            np.minimum(np.asarray(freqs, dtype=np.int64), np.iinfo(np.uint16).max).astype("<u2")[order],
+            np.asarray(lengths, dtype="<u4"),
+            k1,
+            b,
+        )
+
+    def __len__(self):
+        return len(self.lengths)
+
+    def search(self, query, top_k=5):
+        """
+        Rank chunks by BM25 score for a text query.
+
+        Returns:
+            list: (row index, score) pairs, best first; rows without any query term are left out.
+        """
+        rows, contributions = [], []
+        count = len(self.lengths)
+        for term in set(tokenize(query)):
+            term_id = self.vocabulary.get(term)
+            if term_id is None:
+                continue
+            start, end = int(self.offsets[term_id]), int(self.offsets[term_id + 1])
+            docs = self.docs[start:end]
+            freqs = self.freqs[start:end].astype(np.float32)
+            idf = math.log(1.0 + (count - (end - start) + 0.5) / (end - start + 0.5))
+            norm = self.k1 * (1.0 - self.b + self.b * self.lengths[docs] / self.avg_length)
+            rows.append(docs)
+            contributions.append(idf * freqs * (self.k1 + 1.0) / (freqs + norm))
+        if not rows:
+            return []
+        # Sum the per-term scores of every row that matched at least one term
+        matched, inverse = np.unique(np.concatenate(rows), return_inverse=True)
+        scores = np.bincount(inverse, weights=np.concatenate(contributions)).astype(np.float32)
+        return [(int(matched[i]), score) for i, score in top_k_rows(scores, top_k)]
+
+    def save(self, directory):
+        self.offsets.astype("<u8").tofile(os.path.join(directory, LEXICAL_OFFSETS_FILE))
+        self.docs.astype("<u4").tofile(os.path.join(directory, LEXICAL_DOCS_FILE))
+        self.freqs.astype("<u2").tofile(os.path.join(directory, LEXICAL_FREQS_FILE))
+        self.lengths.astype("<u4").tofile(os.path.join(directory, LEXICAL_LENGTHS_FILE))
+        with open(os.path.join(directory, LEXICAL_FILE), "w", encoding="utf-8") as f:
+            json.dump({"k1": self.k1, "b": self.b, "postings": len(self.docs), "terms": self.terms}, f)
+
+    @classmethod
+    def load(cls, directory, count):
+        """Memory-map a saved index, or return None if the directory has none."""
+        path = os.path.join(directory, LEXICAL_FILE)
+        if not os.path.exists(path):
+            return None
+        with open(path, "r", encoding="utf-8") as f:
+            header = json.load(f)
+
+        def mapped(name, dtype, length):
+            if not length:
+                return np.empty(0, dtype=dtype)
+            return np.memmap(os.path.join(directory, name), dtype=dtype, mode="r", shape=(length,))
+
+        return cls(
+            header["terms"],
+            mapped(LEXICAL_OFFSETS_FILE, "<u8", len(header["terms"]) + 1),
+            mapped(LEXICAL_DOCS_FILE, "<u4", header["postings"]),
+            mapped(LEXICAL_FREQS_FILE, "<u2", header["postings"]),
+            mapped(LEXICAL_LENGTHS_FILE, "<u4", count),
+            header["k1"],
+            header["b"],
+        )
+
+
+def reciprocal_rank_fusion(rankings, top_k=5, k=RRF_K):
+    """
+    Merge several rankings of the same rows by reciprocal rank fusion.
+
+    Each row scores ``sum(1 / (k + rank))`` over the rankings it appears
+    in, so rows ranked well by both lexical and vector search come first
+    without having to calibrate BM25 scores against cosine similarities.
+
+    Args:
+        rankings (list): Lists of (row index, score) pairs, best first.
+        top_k (int): Number of rows to return.
+        k (int): Rank offset.
+
+    Returns:
+        list: (row index, fused score) pairs, best first.
+    """
+    fused = {}
+    for ranking in rankings:
+        for rank, (row, _) in enumerate(ranking, start=1):
+            fused[row] = fused.get(row, 0.0) + 1.0 / (k + rank)
+    return sorted(fused.items(), key=lambda item: item[1], reverse=True)[:top_k]
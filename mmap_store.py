@@ -0,0 +1,155 @@
+import json
+import mmap
+import os
+import shutil
+import numpy as np
+from chunk_metadata import ChunkMetadata
+from lexical_index import BM25Index
+from vector_index import VectorIndex
+
+# On-disk layout of a saved VectorIndex directory
+HEADER_FILE = "header.json"
+EMBEDDINGS_FILE = "embeddings.f32"
+CHUNKS_FILE = "chunks.bin"
+OFFSETS_FILE = "offsets.u64"
+ANN_FILE = "ann.npz"
+TOKEN_COUNTS_FILE = "token_counts.u32"
+
+FORMAT_NAME = "assist-genie-vectors"
+FORMAT_VERSION = 1
+
+
+class MappedChunks:
+    """
+    Read-only sequence of chunk texts backed by a memory-mapped file.
+
+    Texts are stored back to back as UTF-8 with an (n + 1) uint64 offsets
+    array, and only decoded when accessed.
+    """
+
+    def __init__(self, chunks_path, offsets_path, count):
+        self._offsets = np.memmap(offsets_path, dtype="<u8", mode="r", shape=(count + 1,))
+        self._file = open(chunks_path, "rb")
+        size = os.fstat(self._file.fileno()).st_size
+        self._data = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ) if size else b""
+
+    def __len__(self):
+        return len(self._offsets) - 1
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(len(self)))]
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError("chunk index out of range")
+        return bytes(self._data[self._offsets[i]:self._offsets[i + 1]]).decode("utf-8")
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+
+def save_index(directory, index, metadata=None):
+    """
+    Write a VectorIndex to a directory in the memory-mappable format.
+
+    The directory is written under a temporary name and swapped in at the
+    end, so readers never see a half-written store.
+
+    Args:
+        directory (str): Target directory; replaced if it exists.
+        index (VectorIndex): Index to save.
+        metadata (dict): Extra JSON-serializable values stored in the header.
+    """
+    tmp_dir = f"{directory}.tmp"
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+
+    embeddings = np.ascontiguousarray(index.embeddings, dtype="<f4")
+    embeddings.tofile(os.path.join(tmp_dir, EMBEDDINGS_FILE))
+
+    offsets = np.zeros(len(index) + 1, dtype="<u8")
+    with open(os.path.join(tmp_dir, CHUNKS_FILE), "wb") as f:
+        for i, chunk in enumerate(index.chunks):
+            encoded = chunk.encode("utf-8")
+            f.write(encoded)
+            offsets[i + 1] = offsets[i] + len(encoded)
+    offsets.tofile(os.path.join(tmp_dir, OFFSETS_FILE))
+
+    if index.ann is not None:
+        index.ann.save(os.path.join(tmp_dir, ANN_FILE))
+
+    if index.token_counts is not None:
+        np.asarray(index.token_counts, dtype="<u4").tofile(os.path.join(tmp_dir, TOKEN_COUNTS_FILE))
+
+    if index.sources is not None:
+        index.sources.save(tmp_dir)
+
+    if index.lexical is not None:
+        index.lexical.save(tmp_dir)
+
+    header = {
+        "format": FORMAT_NAME,
+        "format_version": FORMAT_VERSION,
+        "count": len(index),
+        "dimension": index.dimension or 0,
+        "dtype": "float32",
+        "metadata": metadata or {},
+    }
+    with open(os.path.join(tmp_dir, HEADER_FILE), "w", encoding="utf-8") as f:
+        json.dump(header, f, indent=2)
+
+    old_dir = f"{directory}.old"
+    if os.path.exists(directory):
+        shutil.rmtree(old_dir, ignore_errors=True)
+        os.replace(directory, old_dir)
+    os.replace(tmp_dir, directory)
+    shutil.rmtree(old_dir, ignore_errors=True)
+
+
+def read_header(directory):
+    with open(os.path.join(directory, HEADER_FILE), "r", encoding="utf-8") as f:
+        header = json.load(f)
+    if header.get("format") != FORMAT_NAME or header.get("format_version") != FORMAT_VERSION:
+        raise ValueError(f"Unsupported vector store format in {directory}")
+    return header
+
+
+def load_index(directory):
+    """
+    Open a saved VectorIndex without copying its vectors into the Python heap.
+
+    The embeddings matrix and chunk texts are memory-mapped read-only, so
+    processes on the same host share the same physical pages. Adding to the
+    returned index copies it into memory first.
+
+    Args:
+        directory (str): Directory written by save_index().
+
+    Returns:
+        VectorIndex: The mapped index; its header metadata is in ``index.metadata``.
+    """
+    header = read_header(directory)
+    count, dimension = header["count"], header["dimension"]
+    if count:
+        matrix = np.memmap(os.path.join(directory, EMBEDDINGS_FILE), dtype="<f4", mode="r", shape=(count, dimension))
+    else:
+        matrix = np.empty((0, dimension), dtype=np.float32)
+    chunks = MappedChunks(os.path.join(directory, CHUNKS_FILE), os.path.join(directory, OFFSETS_FILE), count)
+
+    index = VectorIndex.from_arrays(matrix, chunks)
+    index.metadata = header["metadata"]
+    token_counts_path = os.path.join(directory, TOKEN_COUNTS_FILE)
+    if count and os.path.exists(token_counts_path):
+        index.token_counts = np.memmap(token_counts_path, dtype="<u4", mode="r", shape=(count,))
+    index.sources = ChunkMetadata.load(directory, count)
+    index.lexical = BM25Index.load(directory, count)
+    ann_path = os.path.join(directory, ANN_FILE)
+    if count and os.path.exists(ann_path):
+        index.load_ann(ann_path)
+    return index
+
+
+def remove_index(directory):
+    shutil.rmtree(directory, ignore_errors=True)
@@ -0,0 +1,161 @@
+import os
+import numpy as np
+
+# Relevance/diversity trade-off of maximal marginal relevance: 1 ranks by
+# relevance alone (no reranking), lower values penalize near-repeats more
+MMR_LAMBDA = float(os.environ.get("MMR_LAMBDA", "0.7"))
+
+# Candidates retrieved before MMR picks the final top_k
+MMR_FETCH_K = int(os.environ.get("MMR_FETCH_K", "20"))
+
+# Join overlapping chunks from the same page into one context passage
+MERGE_ADJACENT_CHUNKS = os.environ.get("MERGE_ADJACENT_CHUNKS", "1") == "1"
+
+# Shortest shared text counted as overlap between consecutive chunks without offsets
+MIN_TEXT_OVERLAP = 20
+
+
+def mmr(relevance, vectors, top_k, lambda_mult=MMR_LAMBDA):
+    """
+    Maximal marginal relevance selection.
+
+    Each step picks the candidate maximizing ``lambda_mult * relevance -
+    (1 - lambda_mult) * max similarity to the candidates already picked``.
+    The pairwise similarities are computed in one matrix product and the
+    running maximum is updated with one vector operation per pick.
+
+    Args:
+        relevance (np.ndarray): Relevance of each candidate, higher is better.
+        vectors (np.ndarray): Unit-length candidate vectors, one row each.
+        top_k (int): Number of candidates to pick.
+        lambda_mult (float): Relevance/diversity trade-off in [0, 1].
+
+    Returns:
+        list: Positions of the picked candidates, in pick order.
+    """
+    count = len(relevance)
+    top_k = min(top_k, count)
+    if top_k <= 0:
+        return []
+    similarity = vectors @ vectors.T
+    redundancy = np.full(count, -np.inf, dtype=np.float32)
+    available = np.ones(count, dtype=bool)
+    picked = []
+    for _ in range(top_k):
+        penalty = np.where(np.isfinite(redundancy), redundancy, 0.0)
+        scores = np.where(available, lambda_mult * relevance - (1.0 - lambda_mult) * penalty, -np.inf)
+        best = int(np.argmax(scores))
+        picked.append(best)
+        available[best] = False
+        np.maximum(redundancy, similarity[best], out=redundancy)
+    return picked
+
+
+def mmr_rerank(index, hits, top_k, lambda_mult=MMR_LAMBDA):
+    """
+    Rerank search results of a VectorIndex by MMR over their stored vectors.
+
+    Scores are scaled so the best hit has relevance 1, which makes cosine,
+    BM25 and fused scores comparable with the cosine redundancy penalty.
+
+    Args:
+        index (VectorIndex): Index the hits come from.
+        hits (list): (row index, score) pairs, best first, typically more than ``top_k``.
+        top_k (int): Number of hits to keep.
+        lambda_mult (float): Relevance/diversity trade-off; 1 just truncates.
+
+    Returns:
+        list: The kept (row index, score) pairs, in MMR order.
+    """
+    if lambda_mult >= 1.0 or len(hits) <= 1:
+        return hits[:top_k]
+    rows = np.array([row for row, _ in hits])
+    relevance = np.array([score for _, score in hits], dtype=np.float32)
+    if relevance.max() > 0:
+        relevance /= relevance.max()
+    picked = mmr(relevance, np.asarray(index.embeddings[rows], dtype=np.float32), top_k, lambda_mult)
+    return [hits[i] for i in picked]
+
+
+def merge_adjacent(index, hits):
+    """
+    Join hits whose chunks overlap in the source text into single passages.
+
+    With chunk metadata, hits are sorted by document, page and start offset
+    and swept once: a chunk joins the current passage when it starts at or
+    before the furthest end reached so far on the same page, so chains of
+    overlapping chunks merge whatever order they were retrieved in and the
+    shared characters appear once. Without it, consecutive rows merge when
+    the end of one chunk repeats at the start of the next.
+
+    Args:
+        index (VectorIndex): Index the hits come from.
+        hits (list): (row index, score) pairs, best first.
+
+    Returns:
+        list: (rows, text, score) per passage, ordered by its best hit;
+        ``rows`` are in text order and ``score`` is the best of them.
+    """
+    best = {}
+    for rank, (row, score) in enumerate(hits):
+        if row not in best:
+            best[row] = (rank, score)
+
+    groups = []
+    sources = index.sources
+    if sources is not None:
+        columns = sources.columns
+        position = {row: (int(columns["doc_id"][row]), int(columns["page"][row])) for row in best}
+        end = None
+        for row in sorted(best, key=lambda row: (*position[row], int(columns["char_start"][row]))):
+            if groups and position[row] == position[groups[-1][-1]] and int(columns["char_start"][row]) <= end:
+                groups[-1].append(row)
+                end = max(end, int(columns["char_end"][row]))
+            else:
+                groups.append([row])
+                end = int(columns["char_end"][row])
+    else:
+        for row in sorted(best):
+            if groups and row - groups[-1][-1] == 1 and (
+                _text_overlap(index.chunks[groups[-1][-1]], index.chunks[row]) >= MIN_TEXT_OVERLAP
+            ):
+                groups[-1].append(row)
+            else:
+                groups.append([row])
+
+    passages = []
+    for rows in groups:
+        rank, score = min(best[row] for row in rows)
+        passages.append((rank, rows, _join(index, rows), score))
+    passages.sort(key=lambda passage: passage[0])
+    return [(rows, text, score) for _, rows, text, score in passages]
+
+
+def _join(index, rows):
+    sources = index.sources
+    if sources is None:
+        rows.sort()
+        text = index.chunks[rows[0]]
+        for previous, row in zip(rows, rows[1:]):
+            chunk = index.chunks[row]
+            text += chunk[_text_overlap(index.chunks[previous], chunk):]
+        return text
+
+    starts, ends = sources.columns["char_start"], sources.columns["char_end"]
+    rows.sort(key=lambda row: int(starts[row]))
+    text = index.chunks[rows[0]]
+    end = int(ends[rows[0]])
+    for row in rows[1:]:
+        # Skip the characters already covered; a chunk inside the text so far adds nothing
+        if int(ends[row]) > end:
+            text += index.chunks[row][max(end - int(starts[row]), 0):]
+            end = int(ends[row])
+    return text
+
+
+def _text_overlap(first, second):
+    """Length of the longest suffix of ``first`` that is a prefix of ``second``."""
+    for size in range(min(len(first), len(second)), 0, -1):
+        if first.endswith(second[:size]):
+            return size
+    return 0
@@ -0,0 +1,253 @@
+import os
+import numpy as np
+from chunk_metadata import ChunkMetadata
+
+# Queries scored per matrix-matrix product in search_batch(), bounding the (n, block) score matrix
+SEARCH_BATCH_BLOCK = int(os.environ.get("SEARCH_BATCH_BLOCK", "256"))
+
+# Results taken from each of vector and BM25 search before fusing them in search_hybrid()
+HYBRID_CANDIDATES = int(os.environ.get("HYBRID_CANDIDATES", "50"))
+
+
+class VectorIndex:
+    """
+    In-memory cosine-similarity index over text chunks.
+
+    Vectors live in one contiguous float32 matrix whose rows are normalized
+    on insert, so a query is scored with a single matrix-vector product and
+    the top results are picked with a partial sort.
+
+    For large corpora an approximate IVF index can be built on top with
+    build_ann(); searches then only scan the closest lists. Adding vectors
+    discards the ANN index until it is rebuilt.
+
+    build_lexical() adds a BM25 keyword index over the chunks, for keyword
+    search without a query embedding and for hybrid search; it is also
+    discarded by add().
+    """
+
+    def __init__(self, dimension=None):
+        self.dimension = dimension
+        self.chunks = []
+        self._matrix = np.empty((0, dimension or 0), dtype=np.float32)
+        self._size = 0
+        self.ann = None
+        self.lexical = None
+        self.metadata = {}
+        # Token count per row when every add() supplied them, else None
+        self.token_counts = None
+        # Per-row document/page/offsets (ChunkMetadata) when every add() supplied them, else None
+        self.sources = None
+
+    @classmethod
+    def from_arrays(cls, matrix, chunks):
+        """
+        Wrap an existing normalized matrix (e.g. a read-only memmap) and chunk sequence without copying.
+        """
+        index = cls(matrix.shape[1] or None)
+        index._matrix = matrix
+        index._size = len(matrix)
+        index.chunks = chunks
+        return index
+
+    def __len__(self):
+        return self._size
+
+    @property
+    def embeddings(self):
+        """The normalized (n, dimension) float32 matrix, without spare capacity."""
+        return self._matrix[:self._size]
+
+    def add(self, chunks, embeddings, token_counts=None, sources=None):
+        """
+        Append chunks and their embeddings.
+
+        Pairs whose embedding is None (e.g. a failed embedding request) are skipped.
+
+        Args:
+            chunks (list): Text chunks.
+            embeddings (list): One vector (or None) per chunk.
+            token_counts (list): Optional token count per chunk.
+            sources (list): Optional (document, page, char start, char end,
+                token start, token end) per chunk, see ChunkMetadata.
+        """
+        counts = token_counts if token_counts is not None else [None] * len(chunks)
+        locations = sources if sources is not None else [None] * len(chunks)
+        rows = [
+            (chunk, embedding, count, location)
+            for chunk, embedding, count, location in zip(chunks, embeddings, counts, locations)
+            if embedding is not None
+        ]
+        if not rows:
+            return
+        vectors = normalize_rows(np.asarray([embedding for _, embedding, _, _ in rows], dtype=np.float32))
+        if self.dimension is None:
+            self.dimension = vectors.shape[1]
+            self._matrix = np.empty((0, self.dimension), dtype=np.float32)
+        if vectors.shape[1] != self.dimension:
+            raise ValueError(f"Expected {self.dimension}-dimensional embeddings, got {vectors.shape[1]}")
+
+        if not isinstance(self.chunks, list):
+            self.chunks = list(self.chunks)
+        if token_counts is not None and (self._size == 0 or self.token_counts is not None):
+            if not isinstance(self.token_counts, list):
+                self.token_counts = list(self.token_counts if self.token_counts is not None else [])
+            self.token_counts.extend(int(count) for _, _, count, _ in rows)
+        else:
+            self.token_counts = None
+        if sources is not None and (self._size == 0 or self.sources is not None):
+            if self.sources is None:
+                self.sources = ChunkMetadata()
+            self.sources.extend([location for _, _, _, location in rows])
+        else:
+            self.sources = None
+        needed = self._size + len(vectors)
+        if needed > len(self._matrix):
+            # Grow geometrically so repeated adds stay amortized O(n).
+            grown = np.empty((max(needed, 2 * len(self._matrix)), self.dimension), dtype=np.float32)
+            grown[:self._size] = self._matrix[:self._size]
+            self._matrix = grown
+        self._matrix[self._size:needed] = vectors
+        self._size = needed
+        self.chunks.extend(chunk for chunk, _, _, _ in rows)
+        self.ann = None
+        self.lexical = None
+
+    def scores(self, query_embedding):
+        """Cosine similarity of the query against every stored vector."""
+        query = normalize_rows(np.asarray(query_embedding, dtype=np.float32).reshape(1, -1))[0]
+        return self.embeddings @ query
+
+    def search(self, query_embedding, top_k=5, nprobe=None, exact=False):
+        """
+        Find the chunks most similar to a query embedding.
+
+        Args:
+            query_embedding (list): Query vector.
+            top_k (int): Number of results to return.
+            nprobe (int): IVF lists to scan when an ANN index is built.
+            exact (bool): Force brute-force scoring even if an ANN index exists.
+
+        Returns:
+            list: (row index, score) pairs, best first.
+        """
+        if not self._size:
+            return []
+        if self.ann is not None and not exact:
+            query = normalize_rows(np.asarray(query_embedding, dtype=np.float32).reshape(1, -1))[0]
+            return self.ann.search(self.embeddings, query, top_k, nprobe)
+        return top_k_rows(self.scores(query_embedding), top_k)
+
+    def search_batch(self, query_embeddings, top_k=5, nprobe=None, exact=False):
+        """
+        Search for several queries at once.
+
+        Without an ANN index all queries are scored with one matrix-matrix
+        product per block of SEARCH_BATCH_BLOCK queries instead of one
+        matrix-vector product each.
+
+        Args:
+            query_embeddings (list): Query vectors.
+            top_k (int): Number of results per query.
+            nprobe (int): IVF lists to scan when an ANN index is built.
+            exact (bool): Force brute-force scoring even if an ANN index exists.
+
+        Returns:
+            list: One list of (row index, score) pairs per query, best first.
+        """
+        if not len(query_embeddings):
+            return []
+        if not self._size:
+            return [[] for _ in query_embeddings]
+        queries = normalize_rows(np.asarray(query_embeddings, dtype=np.float32).reshape(len(query_embeddings), -1))
+        if self.ann is not None and not exact:
+            return [self.ann.search(self.embeddings, query, top_k, nprobe) for query in queries]
+
+        results = []
+        for start in range(0, len(queries), SEARCH_BATCH_BLOCK):
+            scores = self.embeddings @ queries[start:start + SEARCH_BATCH_BLOCK].T
+            results.extend(top_k_rows(column, top_k) for column in scores.T)
+        return results
+
+    def search_lexical(self, query, top_k=5):
+        """
+        Find the chunks best matching a text query by BM25, without an embedding.
+
+        Returns:
+            list: (row index, BM25 score) pairs, best first; empty without a lexical index.
+        """
+        if self.lexical is None:
+            return []
+        return self.lexical.search(query, top_k)
+
+    def search_hybrid(self, query_embedding, query, top_k=5, candidates=HYBRID_CANDIDATES, nprobe=None):
+        """
+        Combine vector and BM25 search by reciprocal rank fusion.
+
+        Falls back to plain vector search when no lexical index is built.
+
+        Args:
+            query_embedding (list): Query vector.
+            query (str): Query text.
+            top_k (int): Number of results to return.
+            candidates (int): Results taken from each search before fusing.
+            nprobe (int): IVF lists to scan when an ANN index is built.
+
+        Returns:
+            list: (row index, fused score) pairs, best first.
+        """
+        if self.lexical is None:
+            return self.search(query_embedding, top_k, nprobe)
+        from lexical_index import reciprocal_rank_fusion
+        dense = self.search(query_embedding, max(candidates, top_k), nprobe)
+        return reciprocal_rank_fusion([dense, self.lexical.search(query, max(candidates, top_k))], top_k)
+
+    def build_lexical(self):
+        """Build a BM25 index over the current chunks (see lexical_index.BM25Index)."""
+        from lexical_index import BM25Index
+        self.lexical = BM25Index.build(self.chunks)
+        return self.lexical
+
+    def build_ann(self, nlist=None, n_iter=20):
+        """Build an IVF approximate index over the current vectors (see ann_index.IVFIndex)."""
+        from ann_index import IVFIndex
+        self.ann = IVFIndex(nlist=nlist, n_iter=n_iter).build(self.embeddings)
+        return self.ann
+
+    def save_ann(self, path):
+        if self.ann is None:
+            raise ValueError("ANN index not built!")
+        self.ann.save(path)
+
+    def load_ann(self, path):
+        """
+        Load a saved ANN index if it was built on exactly these vectors.
+
+        Returns:
+            bool: True if the index was loaded, False if missing or stale.
+        """
+        from ann_index import IVFIndex, matrix_fingerprint
+        if not os.path.exists(path):
+            return False
+        ann = IVFIndex.load(path)
+        if ann.fingerprint != matrix_fingerprint(self.embeddings):
+            return False
+        self.ann = ann
+        return True
+
+
+def normalize_rows(matrix):
+    """Scale each row to unit length; all-zero rows are left as zeros."""
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+def top_k_rows(scores, top_k):
+    """(index, score) pairs of the top_k highest scores, best first, using a partial sort."""
+    top_k = min(top_k, len(scores))
+    if top_k <= 0:
+        return []
+    candidates = np.argpartition(-scores, top_k - 1)[:top_k]
+    ordered = candidates[np.argsort(-scores[candidates], kind="stable")]
+    return [(int(i), float(scores[i])) for i in ordered]
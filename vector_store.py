@@ -1,4 +1,15 @@
+import asyncio
+import os
+from typing import Any, List
 from langchain_community.vectorstores import Chroma
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+from rerank import MERGE_ADJACENT_CHUNKS, MMR_FETCH_K, MMR_LAMBDA, merge_adjacent, mmr_rerank
+from vector_index import HYBRID_CANDIDATES
+
+# How IndexRetriever ranks chunks: "dense" (embeddings only), "hybrid" (embeddings
+# fused with BM25) or "lexical" (BM25 only, no query embedding needed)
+RETRIEVAL_MODE = os.environ.get("RETRIEVAL_MODE", "hybrid")
 
 class VectorStore:
     def __init__(self, embeddings):
@@ -14,3 +25,111 @@ class VectorStore:
             return self.vector_store.as_retriever()
         else:
             raise ValueError("Vector store not initialized!")
+
+class IndexRetriever(BaseRetriever):
+    """
+    LangChain retriever over a VectorIndex, e.g. a memory-mapped index snapshot.
+
+    Without a query embedding (lexical mode, or the embedding service
+    failed) chunks are ranked by the index's BM25 keyword index alone.
+
+    Before the chunks reach the chain, ``fetch_k`` candidates are reranked
+    by maximal marginal relevance down to ``top_k``, and chunks that overlap
+    in the source text are joined so repeated sentences are sent only once.
+    """
+
+    index: Any
+    embeddings: Any
+    top_k: int = 4
+    # Drop lower-ranked chunks beyond this many tokens of context (0 = no limit);
+    # needs an index built with token counts
+    max_context_tokens: int = 0
+    mode: str = RETRIEVAL_MODE
+    # MMR trade-off (1 = no reranking) and how many candidates it picks from
+    mmr_lambda: float = MMR_LAMBDA
+    fetch_k: int = MMR_FETCH_K
+    merge_adjacent_chunks: bool = MERGE_ADJACENT_CHUNKS
+
+    def _get_relevant_documents(self, query, *, run_manager=None) -> List[Document]:
+        query_embedding = None if self.mode == "lexical" else self.embeddings.embed_query(query)
+        return self.documents_for_embedding(query_embedding, query)
+
+    async def _aget_relevant_documents(self, query, *, run_manager=None) -> List[Document]:
+        query_embedding = None if self.mode == "lexical" else await self.embeddings.aembed_query(query)
+        return await self.adocuments_for_embedding(query_embedding, query)
+
+    def documents_for_embedding(self, query_embedding, query=None):
+        """Retrieve with an already computed query embedding (None for keyword search on ``query``)."""
+        return self._to_documents(self._search(query_embedding, query))
+
+    async def adocuments_for_embedding(self, query_embedding, query=None):
+        # Scoring is NumPy work that releases the GIL; keep it off the event loop.
+        hits = await asyncio.to_thread(self._search, query_embedding, query)
+        return self._to_documents(hits)
+
+    async def adocuments_for_embeddings(self, query_embeddings, queries=None):
+        """
+        Retrieve for several queries with one batched index search.
+
+        ``query_embeddings`` may be None to search by the ``queries`` texts alone.
+        """
+        hits = await asyncio.to_thread(self._search_batch, query_embeddings, queries)
+        return [self._to_documents(query_hits) for query_hits in hits]
+
+    def _search(self, query_embedding, query):
+        fetch_k = self._fetch_k()
+        if query_embedding is None:
+            hits = self.index.search_lexical(query, fetch_k)
+        elif query is not None and self.mode == "hybrid":
+            hits = self.index.search_hybrid(query_embedding, query, fetch_k)
+        else:
+            hits = self.index.search(query_embedding, fetch_k)
+        return mmr_rerank(self.index, hits, self.top_k, self.mmr_lambda)
+
+    def _search_batch(self, query_embeddings, queries):
+        fetch_k = self._fetch_k()
+        if query_embeddings is None:
+            hits = [self.index.search_lexical(query, fetch_k) for query in queries]
+        elif queries is None or self.mode != "hybrid" or self.index.lexical is None:
+            hits = self.index.search_batch(query_embeddings, fetch_k)
+        else:
+            from lexical_index import reciprocal_rank_fusion
+            candidates = max(HYBRID_CANDIDATES, fetch_k)
+            hits = [
+                reciprocal_rank_fusion([dense, self.index.search_lexical(query, candidates)], fetch_k)
+                for dense, query in zip(self.index.search_batch(query_embeddings, candidates), queries)
+            ]
+        return [mmr_rerank(self.index, query_hits, self.top_k, self.mmr_lambda) for query_hits in hits]
+
+    def _fetch_k(self):
+        return max(self.fetch_k, self.top_k) if self.mmr_lambda < 1.0 else self.top_k
+
+    def _to_documents(self, hits):
+        token_counts = self.index.token_counts
+        sources = self.index.sources
+        if self.merge_adjacent_chunks:
+            passages = merge_adjacent(self.index, hits)
+        else:
+            passages = [([i], self.index.chunks[i], score) for i, score in hits]
+        documents = []
+        used_tokens = 0
+        for rows, text, score in passages:
+            metadata = {"row": rows[0], "score": score}
+            if len(rows) > 1:
+                metadata["rows"] = rows
+            if sources is not None:
+                # document, page, char_start, char_end, token_start, token_end of the whole passage
+                columns = sources.columns
+                metadata.update(sources.get(rows[0]))
+                metadata["char_end"] = max(int(columns["char_end"][i]) for i in rows)
+                metadata["token_end"] = max(int(columns["token_end"][i]) for i in rows)
+            if token_counts is not None:
+                if sources is not None:
+                    metadata["tokens"] = metadata["token_end"] - metadata["token_start"]
+                else:
+                    metadata["tokens"] = sum(int(token_counts[i]) for i in rows)
+                used_tokens += metadata["tokens"]
+                if self.max_context_tokens and documents and used_tokens > self.max_context_tokens:
+                    break
+            documents.append(Document(page_content=text, metadata=metadata))
+        return documents